@@ -25,10 +25,13 @@ Specjalne właściwości:
 """
 
 import asyncio
+import threading
 import uuid
 import time
+import orjson
 import structlog
-from typing import Literal
+from collections import deque
+from typing import Iterable, Literal, get_type_hints
 from langgraph.graph import StateGraph, END, START
 from langgraph.checkpoint.memory import MemorySaver
 
@@ -253,6 +256,165 @@ def zbuduj_graf_nexus() -> StateGraph:
     return graf
 
 
+# Reduktory pól StanNEXUS (Annotated[..., reduktor]) — potrzebne, by
+# odtworzyć pełny stan z delt węzłów bez czytania checkpointera
+_REDUKTORY_STANU = {
+    pole: meta[-1]
+    for pole, typ in get_type_hints(StanNEXUS, include_extras=True).items()
+    if (meta := getattr(typ, "__metadata__", None)) and callable(meta[-1])
+}
+
+
+def zastosuj_aktualizacje(stan: dict, delta: dict | None) -> None:
+    """Nakłada deltę węzła (astream, tryb "updates") na stan — tak jak LangGraph."""
+    if not delta:
+        return
+    for pole, wartosc in delta.items():
+        reduktor = _REDUKTORY_STANU.get(pole)
+        if reduktor is not None and stan.get(pole) is not None:
+            stan[pole] = reduktor(stan[pole], wartosc)
+        else:
+            stan[pole] = wartosc
+
+
+# ====================================================================
+# STAN SESJI W REDIS
+# ====================================================================
+
+# MemorySaver żyje w pamięci jednego procesu — status sesji prowadzonej
+# przez workera Celery (albo sprzed restartu API) byłby niewidoczny.
+# Skrót stanu po każdym węźle trafia do Redis, wspólnego dla procesów.
+TTL_STANU_SESJI_S = 86400
+
+_redis_stanu = None
+_petla_redis_stanu: asyncio.AbstractEventLoop | None = None
+
+
+def _pobierz_redis_stanu():
+    """Zwraca klienta Redis dla bieżącej pętli zdarzeń (Celery tworzy nową pętlę per zadanie)."""
+    global _redis_stanu, _petla_redis_stanu
+    petla = asyncio.get_running_loop()
+    if _redis_stanu is None or _petla_redis_stanu is not petla:
+        import redis.asyncio as aioredis
+        _redis_stanu = aioredis.from_url(konf.REDIS_URL)
+        _petla_redis_stanu = petla
+    return _redis_stanu
+
+
+async def zamknij_redis_stanu() -> None:
+    """Zamyka klienta Redis stanu sesji (shutdown aplikacji)."""
+    global _redis_stanu, _petla_redis_stanu
+    if _redis_stanu is not None:
+        await _redis_stanu.aclose()
+    _redis_stanu = None
+    _petla_redis_stanu = None
+
+
+def _skrot_stanu(sesja_id: str, wartosci: dict) -> dict:
+    return {
+        "sesja_id": sesja_id,
+        "krok": wartosci.get("krok_aktualny", "nieznany"),
+        "iteracja": wartosci.get("iteracja", 0),
+        "koszt_usd": round(wartosci.get("koszt_calkowity_usd", 0.0), 4),
+        "bledy": wartosci.get("bledy", []),
+    }
+
+
+# Stan grafu po ostatnim ukończonym węźle — ponowienie zadania Celery
+# wznawia graf od tego miejsca zamiast płacić drugi raz za gotowe etapy.
+# Hash Redis: pole per klucz stanu + POLE_WEZLA — węzeł dopisuje tylko
+# pola, które zmienił (HSET), zamiast serializować cały stan od nowa.
+POLE_WEZLA = "__wezel"
+
+
+def _klucz_checkpointu(sesja_id: str) -> str:
+    return f"nexus:checkpoint:{sesja_id}"
+
+
+# Zapisy stanu poza ścieżką krytyczną — kolejny węzeł grafu nie czeka
+# na RTT Redis. Jedno zadanie w tle opróżnia kolejkę (kolejność zachowana).
+_kolejka_zapisow: deque[tuple[str, dict, str | None, tuple[str, ...] | None]] = deque()
+_zadanie_zapisow: asyncio.Task | None = None
+
+
+def zaplanuj_zapis_stanu(
+    sesja_id: str,
+    wartosci: dict,
+    wezel: str | None = None,
+    zmienione: Iterable[str] | None = None,
+) -> None:
+    """
+    Kolejkuje zapis skrótu stanu sesji i — gdy podano `zmienione` —
+    tych pól checkpointu (pełne wartości z `wartosci`, więc pola
+    z reducerem, np. bledy, zapisują się już zakumulowane).
+
+    Nie blokuje — zapis wykonuje zadanie w tle. Przed końcem pipeline'u
+    wywołaj oproznij_zapisy_stanu().
+    """
+    global _zadanie_zapisow
+    _kolejka_zapisow.append(
+        (sesja_id, wartosci, wezel, tuple(zmienione) if zmienione is not None else None)
+    )
+    petla = asyncio.get_running_loop()
+    if (
+        _zadanie_zapisow is None
+        or _zadanie_zapisow.done()
+        or _zadanie_zapisow.get_loop() is not petla
+    ):
+        _zadanie_zapisow = petla.create_task(_pisz_stany())
+
+
+async def _pisz_stany() -> None:
+    """Opróżnia kolejkę zapisów: skrót + pola checkpointu jednym round-tripem (pipeline Redis)."""
+    while _kolejka_zapisow:
+        sesja_id, wartosci, wezel, zmienione = _kolejka_zapisow.popleft()
+        try:
+            potok = _pobierz_redis_stanu().pipeline(transaction=False)
+            potok.set(
+                f"nexus:sesja:{sesja_id}",
+                orjson.dumps(_skrot_stanu(sesja_id, wartosci)),
+                ex=TTL_STANU_SESJI_S,
+            )
+            if zmienione is not None:
+                pola = {k: orjson.dumps(wartosci.get(k)) for k in zmienione}
+                if wezel is not None:
+                    pola[POLE_WEZLA] = wezel
+                if pola:
+                    klucz = _klucz_checkpointu(sesja_id)
+                    potok.hset(klucz, mapping=pola)
+                    potok.expire(klucz, TTL_STANU_SESJI_S)
+            await potok.execute()
+        except Exception as e:
+            logger.debug("Nie udało się zapisać stanu sesji w Redis", blad=str(e))
+
+
+async def oproznij_zapisy_stanu() -> None:
+    """Czeka aż zakolejkowane zapisy stanu trafią do Redis."""
+    zadanie = _zadanie_zapisow
+    if zadanie is not None and not zadanie.done() and zadanie.get_loop() is asyncio.get_running_loop():
+        await zadanie
+
+
+async def wczytaj_checkpoint_sesji(sesja_id: str) -> tuple[str, dict] | None:
+    """Zwraca (ostatni ukończony węzeł, stan) albo None gdy żaden węzeł się nie ukończył."""
+    try:
+        pola = await _pobierz_redis_stanu().hgetall(_klucz_checkpointu(sesja_id))
+        wezel = pola.pop(POLE_WEZLA.encode(), None)
+        if wezel is not None:
+            return wezel.decode(), {k.decode(): orjson.loads(v) for k, v in pola.items()}
+    except Exception as e:
+        logger.debug("Nie udało się wczytać checkpointu sesji", blad=str(e))
+    return None
+
+
+async def usun_checkpoint_sesji(sesja_id: str) -> None:
+    """Usuwa checkpoint po zakończonym pipeline."""
+    try:
+        await _pobierz_redis_stanu().delete(_klucz_checkpointu(sesja_id))
+    except Exception as e:
+        logger.debug("Nie udało się usunąć checkpointu sesji", blad=str(e))
+
+
 # ====================================================================
 # GŁÓWNA KLASA ORKIESTRATORA
 # ====================================================================
@@ -333,24 +495,38 @@ class OrkiestratorNEXUS:
 
         config = {"configurable": {"thread_id": sesja_id}}
 
+        # Pełny stan składany z delt streamu — bez get_state() po każdym
+        # węźle; zapis do Redis jak w zadaniu Celery (_uruchom_z_postepem)
+        stan_wartosci = dict(stan_poczatkowy)
+        zaplanuj_zapis_stanu(sesja_id, stan_poczatkowy, zmienione=stan_poczatkowy)
+
         try:
             # Uruchom pipeline
-            wynik_koncowy = None
-            async for zdarzenie in self._app.astream(stan_poczatkowy, config=config):
-                for wezel, dane in zdarzenie.items():
-                    self._log.info(
-                        "Postęp pipeline",
-                        wezel=wezel,
-                        krok=dane.get("krok_aktualny", "?"),
-                        koszt=round(dane.get("koszt_calkowity_usd", 0), 4)
+            try:
+                async for zdarzenie in self._app.astream(
+                    stan_poczatkowy, config=config, stream_mode="updates",
+                ):
+                    for wezel, dane in zdarzenie.items():
+                        zastosuj_aktualizacje(stan_wartosci, dane)
+                        self._log.info(
+                            "Postęp pipeline",
+                            wezel=wezel,
+                            krok=stan_wartosci.get("krok_aktualny", "?"),
+                            koszt=round(stan_wartosci.get("koszt_calkowity_usd", 0), 4)
+                        )
+                    zaplanuj_zapis_stanu(
+                        sesja_id,
+                        dict(stan_wartosci),
+                        wezel,
+                        zmienione=[k for d in zdarzenie.values() if d for k in d],
                     )
-                    wynik_koncowy = dane
+            finally:
+                await oproznij_zapisy_stanu()
 
-            czas_calkowity = time.time() - czas_start
+            # Pipeline ukończony — checkpoint do wznowienia nie jest potrzebny
+            await usun_checkpoint_sesji(sesja_id)
 
-            # Pobierz finalny stan
-            stan_finalny = self._app.get_state(config)
-            stan_wartosci = stan_finalny.values if hasattr(stan_finalny, 'values') else {}
+            czas_calkowity = time.time() - czas_start
 
             self._log.info(
                 "Generacja zakończona",
@@ -387,29 +563,55 @@ class OrkiestratorNEXUS:
                 "czas_generacji_s": round(czas_calkowity, 1),
             }
 
-    def pobierz_stan_sesji(self, sesja_id: str) -> dict:
-        """Pobiera aktualny stan sesji (do monitorowania postępu)."""
+    async def pobierz_stan_sesji(self, sesja_id: str) -> dict:
+        """
+        Pobiera aktualny stan sesji (do monitorowania postępu).
+
+        Najpierw checkpoint w pamięci tego procesu, potem skrót w Redis
+        (sesje z workerów Celery i sprzed restartu).
+        """
         config = {"configurable": {"thread_id": sesja_id}}
         try:
             stan = self._app.get_state(config)
-            return {
-                "sesja_id": sesja_id,
-                "krok": stan.values.get("krok_aktualny", "nieznany"),
-                "iteracja": stan.values.get("iteracja", 0),
-                "koszt_usd": round(stan.values.get("koszt_calkowity_usd", 0.0), 4),
-                "bledy": stan.values.get("bledy", []),
-            }
+            if stan.values:
+                return _skrot_stanu(sesja_id, stan.values)
         except Exception:
-            return {"sesja_id": sesja_id, "status": "nie_znaleziono"}
+            pass
+
+        try:
+            surowy = await _pobierz_redis_stanu().get(f"nexus:sesja:{sesja_id}")
+            if surowy:
+                return orjson.loads(surowy)
+        except Exception as e:
+            self._log.debug("Redis stanu sesji niedostępny", blad=str(e))
+
+        return {"sesja_id": sesja_id, "status": "nie_znaleziono"}
+
+    def zwolnij_sesje(self, sesja_id: str) -> None:
+        """
+        Usuwa checkpointy sesji z MemorySaver.
+
+        Worker Celery trzyma jeden orkiestrator przez całe życie procesu —
+        bez tego pamięć rosłaby z każdą wygenerowaną sesją.
+        """
+        # MemorySaver (langgraph-checkpoint 2.0.x, przypięty przez
+        # langgraph==0.2.62): storage[thread_id][ns][checkpoint_id],
+        # writes[(thread_id, ns, checkpoint_id)]
+        self._saver.storage.pop(sesja_id, None)
+        for klucz in [k for k in self._saver.writes if k[0] == sesja_id]:
+            del self._saver.writes[klucz]
 
 
-# Singleton orkiestratora
+# Singleton orkiestratora (API i proces workera Celery)
 _orkiestrator_instancja: OrkiestratorNEXUS | None = None
+_blokada_orkiestratora = threading.Lock()
 
 
 def pobierz_orkiestratora() -> OrkiestratorNEXUS:
     """Zwraca singleton orkiestratora."""
     global _orkiestrator_instancja
     if _orkiestrator_instancja is None:
-        _orkiestrator_instancja = OrkiestratorNEXUS()
+        with _blokada_orkiestratora:
+            if _orkiestrator_instancja is None:
+                _orkiestrator_instancja = OrkiestratorNEXUS()
     return _orkiestrator_instancja
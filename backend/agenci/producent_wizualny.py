@@ -20,12 +20,31 @@ Nowości v2.0:
 """
 
 import os
-import asyncio
 import json
+import shutil
+import asyncio
+import time
+import hashlib
 import structlog
 import httpx
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from openai import AsyncOpenAI
+from typing import Awaitable
+from uuid import uuid4
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import (
+    retry,
+    retry_if_exception,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
 from konfiguracja import konf
 from agenci.schematy import StanNEXUS, WizualiaWideo, ObrazSceny
@@ -68,11 +87,40 @@ EMOCJA_DO_WIZUALU = {
 # Próg spójności wizualnej — poniżej: scena jest "outlierem" stylistycznym
 PROG_SPOJNOSCI_WIZUALNEJ = 0.50
 
+# Max równoległych wywołań DALL-E per wideo (limit API)
+MAKS_ROWNOLEGLYCH_OBRAZOW = 3
+
+# Rozmiar fragmentu przy strumieniowym pobieraniu obrazów (64 KB)
+ROZMIAR_FRAGMENTU_POBIERANIA = 64 * 1024
+
 
 # ====================================================================
 # OPTYMALIZACJA PROMPTÓW
 # ====================================================================
 
+# Stała część każdego promptu — jakość i format niezależne od sceny
+SUFIKS_JAKOSCI_PROMPTU = (
+    "ultra-HD quality, cinematic composition, professional photography, "
+    "vertical 9:16 format, no text overlays, no watermarks, photorealistic render"
+)
+
+
+@lru_cache(maxsize=256)
+def _sufiks_promptu(styl_wizualny: str, emocja: str) -> str:
+    """
+    Zwraca gotowy sufiks promptu (styl DALL-E + nastrój + jakość).
+
+    Składany raz per (styl, emocja) — w obrębie wideo para się powtarza,
+    więc per scena zostaje tylko podstawienie opisu i prefiksów.
+    """
+    styl_dall_e = STYL_DO_DALL_E.get(
+        styl_wizualny.split(",")[0].strip().lower(),
+        "professional, high quality, vibrant"
+    )
+    emocja_wizualna = EMOCJA_DO_WIZUALU.get(emocja.lower(), "engaging, dynamic")
+    return f"{styl_dall_e}, {emocja_wizualna}, {SUFIKS_JAKOSCI_PROMPTU}"
+
+
 def zoptymalizuj_prompt(
     opis_sceny: str,
     styl_wizualny: str,
@@ -86,12 +134,6 @@ def zoptymalizuj_prompt(
     styl_referencyjny: opcjonalny prefix stylistyczny dla spójności wizualnej
     (używany przez INNOWACJĘ 7 przy regeneracji outlierów).
     """
-    styl_dall_e = STYL_DO_DALL_E.get(
-        styl_wizualny.split(",")[0].strip().lower(),
-        "professional, high quality, vibrant"
-    )
-    emocja_wizualna = EMOCJA_DO_WIZUALU.get(emocja.lower(), "engaging, dynamic")
-
     kolory_marki = marka.get("kolory", "")
     prefix_marki = f"Brand colors: {kolory_marki}. " if kolory_marki else ""
 
@@ -100,9 +142,7 @@ def zoptymalizuj_prompt(
 
     prompt = (
         f"{prefix_spojnosci}{prefix_marki}{opis_sceny}. "
-        f"{styl_dall_e}, {emocja_wizualna}, "
-        f"ultra-HD quality, cinematic composition, professional photography, "
-        f"vertical 9:16 format, no text overlays, no watermarks, photorealistic render"
+        f"{_sufiks_promptu(styl_wizualny, emocja)}"
     )
 
     # DALL-E 3 limit 4000 znaków
@@ -168,26 +208,19 @@ Odpowiedz TYLKO JSON:
             max_tokens=100,
         )
         dane = json.loads(resp.choices[0].message.content)
-        indeksy = dane.get("indeksy_scen", [])
 
-        # Walidacja: muszą być prawidłowe indeksy
-        indeksy = [i for i in indeksy if 0 <= i < len(sceny)]
+        # Walidacja: muszą być prawidłowe indeksy — zbiór zamiast skanów listy
+        wybrane = {i for i in dane.get("indeksy_scen", []) if 0 <= i < len(sceny)}
 
         # Zawsze uwzględnij scenę 0 i ostatnią
-        if 0 not in indeksy:
-            indeksy.insert(0, 0)
-        if len(sceny) - 1 not in indeksy:
-            indeksy.append(len(sceny) - 1)
+        wybrane.update((0, len(sceny) - 1))
 
-        indeksy = sorted(set(indeksy))[:maks]
+        indeksy = sorted(wybrane)[:maks]
 
         if len(indeksy) < maks:
-            # Uzupełnij brakujące pozycje
-            wszystkie = list(range(len(sceny)))
-            for idx in wszystkie:
-                if idx not in indeksy and len(indeksy) < maks:
-                    indeksy.append(idx)
-            indeksy = sorted(set(indeksy))[:maks]
+            # Uzupełnij brakujące pozycje — pierwsze niewybrane, stop po komplecie
+            brakujace = (i for i in range(len(sceny)) if i not in wybrane)
+            indeksy = sorted(indeksy + list(islice(brakujace, maks - len(indeksy))))
 
         logger.info("Semantyczny wybór scen", indeksy=indeksy, maks=maks)
         return indeksy
@@ -283,54 +316,277 @@ def ekstrakcja_stylu_dominujacego(sceny: list[dict]) -> str:
     return f"Maintain visual style consistency with: {opisy[0][:100]}"
 
 
+# ====================================================================
+# KLIENT HTTP POBIERANIA (współdzielony)
+# ====================================================================
+
+# Obrazy DALL-E leżą na jednym hoście CDN — pula keep-alive oszczędza
+# handshake TCP+TLS przy każdym kolejnym obrazie
+LIMITY_POLACZEN_POBIERANIA = httpx.Limits(
+    max_connections=32,
+    max_keepalive_connections=8,
+    keepalive_expiry=60.0,
+)
+
+_klient_pobierania: httpx.AsyncClient | None = None
+_petla_klienta_pobierania: asyncio.AbstractEventLoop | None = None
+
+
+def pobierz_klienta_pobierania() -> httpx.AsyncClient:
+    """
+    Zwraca współdzielonego klienta httpx do pobierania wygenerowanych obrazów.
+
+    Przypięty do pętli zdarzeń — worker Celery tworzy nową pętlę per zadanie,
+    więc wtedy powstaje nowy klient (jak klient TTS w rezyser_glosu).
+    """
+    global _klient_pobierania, _petla_klienta_pobierania
+    petla = asyncio.get_running_loop()
+    if _klient_pobierania is None or _petla_klienta_pobierania is not petla:
+        _klient_pobierania = httpx.AsyncClient(limits=LIMITY_POLACZEN_POBIERANIA)
+        _petla_klienta_pobierania = petla
+    return _klient_pobierania
+
+
+async def zamknij_klienta_pobierania() -> None:
+    """Zamyka współdzielonego klienta pobierania (shutdown aplikacji)."""
+    global _klient_pobierania, _petla_klienta_pobierania
+    if _klient_pobierania is not None:
+        await _klient_pobierania.aclose()
+    _klient_pobierania = None
+    _petla_klienta_pobierania = None
+
+
+# ====================================================================
+# CACHE OBRAZÓW (content-addressed)
+# ====================================================================
+
+# Retry pipeline'u i iteracje nad tym samym briefem wysyłają identyczne
+# prompty — obraz z dysku zamiast kolejnych $0.04 i ~15s DALL-E
+KATALOG_CACHE_OBRAZOW = Path(konf.SCIEZKA_TYMCZASOWA) / "cache" / "obrazy"
+
+# Parametry generacji — część klucza cache
+ROZMIAR_OBRAZU = "1024x1792"
+JAKOSC_OBRAZU = "standard"
+STYL_OBRAZU = "vivid"
+
+# Koszt jednego wywołania DALL-E — trafienie w cache nie kosztuje nic
+KOSZT_OBRAZU_USD = 0.040
+
+
+def klucz_cache_obrazu(model: str, prompt: str) -> str:
+    """Zwraca klucz BLAKE2b dla (model, rozmiar, jakość, styl, prompt) generacji."""
+    skrot = hashlib.blake2b(
+        f"{model}|{ROZMIAR_OBRAZU}|{JAKOSC_OBRAZU}|{STYL_OBRAZU}|".encode(),
+        digest_size=16,
+    )
+    skrot.update(prompt.encode("utf-8"))
+    return skrot.hexdigest()
+
+
+def _sciezka_cache_obrazu(klucz: str) -> Path:
+    return KATALOG_CACHE_OBRAZOW / klucz[:2] / f"{klucz}.png"
+
+
+def _zapisz_w_cache_obrazow(zrodlo: Path, klucz: str) -> None:
+    """Kopiuje wygenerowany obraz do cache (atomowo: plik tymczasowy + os.replace)."""
+    cel = _sciezka_cache_obrazu(klucz)
+    # Unikalny per zapis — równoległe zapisy tego samego klucza (także
+    # w jednym procesie) nie nadpisują sobie pliku tymczasowego
+    tymczasowy = cel.with_suffix(f".{uuid4().hex}.tmp")
+    try:
+        cel.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(zrodlo, tymczasowy)
+        os.replace(tymczasowy, cel)
+    except OSError as e:
+        tymczasowy.unlink(missing_ok=True)
+        logger.debug("Nie udało się zapisać obrazu w cache", blad=str(e))
+
+
+# ====================================================================
+# ODPORNOŚĆ: retry z jitterem + bezpiecznik DALL-E
+# ====================================================================
+
+# Po tylu kolejnych błędach DALL-E przestajemy wołać API na CZAS_OTWARCIA —
+# zamiast stosu żądań czekających na timeout przy awarii po stronie OpenAI
+PROG_BEZPIECZNIKA_OBRAZOW = 5
+CZAS_OTWARCIA_BEZPIECZNIKA_S = 60.0
+
+_bledy_obrazow_z_rzedu = 0
+_bezpiecznik_otwarty_do = 0.0
+
+
+# Kubełek żetonów limitu DALL-E (images/min konta) — wspólny dla procesu.
+# Rezerwacja bez await między odczytem a zapisem = atomowa w asyncio, więc
+# nie potrzeba Locka (który wiązałby się z pętlą — Celery tworzy nową per zadanie)
+_zetony_obrazow = float(konf.LIMIT_OBRAZOW_NA_MINUTE)
+_ostatnie_uzupelnienie = time.monotonic()
+
+
+async def zarezerwuj_wywolanie_dalle() -> None:
+    """
+    Czeka, aż tempo wywołań DALL-E zmieści się w LIMIT_OBRAZOW_NA_MINUTE.
+
+    Równoległe wideo w jednym workerze wygładzają ruch zamiast zbierać 429
+    i spalać budżet ponowień. Żetony mogą zejść poniżej zera — każdy
+    oczekujący śpi dokładnie tyle, ile wynosi jego deficyt.
+    """
+    global _zetony_obrazow, _ostatnie_uzupelnienie
+    pojemnosc = float(konf.LIMIT_OBRAZOW_NA_MINUTE)
+    na_sekunde = pojemnosc / 60.0
+
+    teraz = time.monotonic()
+    _zetony_obrazow = min(
+        pojemnosc, _zetony_obrazow + (teraz - _ostatnie_uzupelnienie) * na_sekunde
+    )
+    _ostatnie_uzupelnienie = teraz
+    _zetony_obrazow -= 1.0
+
+    if _zetony_obrazow < 0:
+        await asyncio.sleep(-_zetony_obrazow / na_sekunde)
+
+
+def _blad_przejsciowy(e: BaseException) -> bool:
+    """Błędy pobierania warte ponowienia: sieć/timeout, 429 i 5xx CDN."""
+    if isinstance(e, httpx.TransportError):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        kod = e.response.status_code
+        return kod == 429 or kod >= 500
+    return False
+
+
+# Błędy po stronie OpenAI, które świadczą o awarii/przeciążeniu API — tylko
+# one liczą się do bezpiecznika (APITimeoutError dziedziczy po
+# APIConnectionError). Odrzucenie promptu (400), błąd pobrania czy dysku
+# dotyczy jednego obrazu i nie powinno blokować pozostałych scen.
+BLEDY_PRZEJSCIOWE_DALLE = (APIConnectionError, RateLimitError, InternalServerError)
+
+
+def _zarejestruj_wynik_generacji(sukces: bool) -> None:
+    global _bledy_obrazow_z_rzedu, _bezpiecznik_otwarty_do
+    if sukces:
+        _bledy_obrazow_z_rzedu = 0
+        return
+    _bledy_obrazow_z_rzedu += 1
+    if _bledy_obrazow_z_rzedu >= PROG_BEZPIECZNIKA_OBRAZOW:
+        _bezpiecznik_otwarty_do = time.monotonic() + CZAS_OTWARCIA_BEZPIECZNIKA_S
+        _bledy_obrazow_z_rzedu = 0
+        logger.warning(
+            "Bezpiecznik DALL-E otwarty",
+            przerwa_s=CZAS_OTWARCIA_BEZPIECZNIKA_S,
+        )
+
+
 # ====================================================================
 # GENERACJA OBRAZÓW
 # ====================================================================
 
+@retry(
+    stop=stop_after_attempt(konf.MAKS_PONOWNYCH_PROB),
+    wait=wait_random_exponential(multiplier=0.5, max=10),
+    retry=retry_if_exception(_blad_przejsciowy),
+    reraise=True,
+)
 async def pobierz_i_zapisz_obraz(
     url: str,
     sciezka: Path,
     timeout: int = 60
 ) -> bool:
-    """Pobiera obraz z URL i zapisuje lokalnie."""
-    async with httpx.AsyncClient(timeout=timeout) as klient_http:
-        odpowiedz = await klient_http.get(url)
-        odpowiedz.raise_for_status()
-        sciezka.parent.mkdir(parents=True, exist_ok=True)
-        sciezka.write_bytes(odpowiedz.content)
+    """
+    Pobiera obraz z URL i zapisuje lokalnie.
+
+    Odpowiedź strumieniowana fragmentami prosto do pliku — PNG 1024x1792
+    (kilka MB) nie jest buforowany w całości w pamięci workera.
+    Zapis do pliku .part + os.replace: zerwane pobranie (i retry) nigdy
+    nie zostawia uciętego PNG pod docelową ścieżką.
+    """
+    klient_http = pobierz_klienta_pobierania()
+    czesciowy = sciezka.with_suffix(sciezka.suffix + ".part")
+    try:
+        async with klient_http.stream("GET", url, timeout=timeout) as odpowiedz:
+            odpowiedz.raise_for_status()
+            sciezka.parent.mkdir(parents=True, exist_ok=True)
+            with open(czesciowy, "wb") as plik:
+                async for fragment in odpowiedz.aiter_bytes(ROZMIAR_FRAGMENTU_POBIERANIA):
+                    plik.write(fragment)
+        os.replace(czesciowy, sciezka)
+    except BaseException:
+        # Także przy anulowaniu — ostatnia nieudana próba nie zostawia .part
+        czesciowy.unlink(missing_ok=True)
+        raise
     return True
 
 
+@retry(
+    stop=stop_after_attempt(konf.MAKS_PONOWNYCH_PROB + 1),
+    wait=wait_random_exponential(multiplier=0.5, max=10),
+    retry=retry_if_exception_type(BLEDY_PRZEJSCIOWE_DALLE),
+    reraise=True,
+)
+async def _wywolaj_dalle(klient: AsyncOpenAI, prompt: str):
+    """
+    Wywołanie images.generate z ponowieniami przez kubełek żetonów.
+
+    Wewnętrzne ponowienia SDK (429/5xx) wysłałyby żądanie ponownie bez
+    żetonu — limit na minutę nie działałby akurat przy throttlingu, dla
+    którego istnieje. Dlatego max_retries=0, a każda próba tenacity
+    najpierw rezerwuje żeton.
+    """
+    await zarezerwuj_wywolanie_dalle()
+    return await klient.with_options(max_retries=0).images.generate(
+        model=konf.MODEL_OBRAZY,
+        prompt=prompt,
+        size=ROZMIAR_OBRAZU,
+        quality=JAKOSC_OBRAZU,
+        n=1,
+        style=STYL_OBRAZU,
+    )
+
+
 async def generuj_obraz_sceny(
     klient: AsyncOpenAI,
     prompt: str,
     sciezka: Path,
     numer_sceny: int,
-) -> tuple[bool, str]:
+) -> tuple[bool, str, float]:
     """
     Generuje obraz dla jednej sceny.
 
     Returns:
-        (sukces, ścieżka_pliku)
+        (sukces, ścieżka_pliku, koszt_usd) — koszt 0 przy trafieniu w cache
     """
+    klucz = klucz_cache_obrazu(konf.MODEL_OBRAZY, prompt)
+    sciezka_cache = _sciezka_cache_obrazu(klucz)
+    koszt = 0.0
+
     try:
-        odpowiedz = await klient.images.generate(
-            model=konf.MODEL_OBRAZY,
-            prompt=prompt,
-            size="1024x1792",
-            quality="standard",
-            n=1,
-            style="vivid",
-        )
+        if sciezka_cache.exists():
+            sciezka.parent.mkdir(parents=True, exist_ok=True)
+            # Kopia PNG (kilka MB) poza pętlą zdarzeń — pozostałe sceny lecą dalej
+            await asyncio.to_thread(shutil.copyfile, sciezka_cache, sciezka)
+            return True, str(sciezka), 0.0
+
+        if time.monotonic() < _bezpiecznik_otwarty_do:
+            logger.warning("Bezpiecznik DALL-E otwarty — pomijam obraz", numer_sceny=numer_sceny)
+            return False, "", 0.0
+
+        odpowiedz = await _wywolaj_dalle(klient, prompt)
+        # Obraz opłacony w chwili odpowiedzi — także gdy pobranie zawiedzie
+        koszt = KOSZT_OBRAZU_USD
+        # API odpowiedziało — błąd pobrania dalej nie dotyczy zdrowia DALL-E
+        _zarejestruj_wynik_generacji(True)
 
         url_obrazu = odpowiedz.data[0].url
         await pobierz_i_zapisz_obraz(url_obrazu, sciezka)
+        await asyncio.to_thread(_zapisz_w_cache_obrazow, sciezka, klucz)
 
-        return True, str(sciezka)
+        return True, str(sciezka), koszt
 
     except Exception as e:
         logger.error("Błąd generacji obrazu", numer_sceny=numer_sceny, blad=str(e))
-        return False, ""
+        if isinstance(e, BLEDY_PRZEJSCIOWE_DALLE):
+            _zarejestruj_wynik_generacji(False)
+        return False, "", koszt
 
 
 # ====================================================================
@@ -366,7 +622,11 @@ async def producent_wizualny(stan: StanNEXUS) -> dict:
     wszystkie_sceny = scenariusz["sceny"]
     maks = konf.MAKS_OBRAZOW_NA_SCENA
 
-    klient = AsyncOpenAI(api_key=konf.OPENAI_API_KEY)
+    # SDK ponawia 429/5xx/timeouty z wykładniczym backoffem i jitterem
+    klient = AsyncOpenAI(
+        api_key=konf.OPENAI_API_KEY,
+        max_retries=konf.MAKS_PONOWNYCH_PROB,
+    )
 
     sesja_id = stan.get("metadane", {}).get("sesja_id", "domyslna")
     katalog_obrazy = Path(konf.SCIEZKA_TYMCZASOWA) / sesja_id / "obrazy"
@@ -389,95 +649,143 @@ async def producent_wizualny(stan: StanNEXUS) -> dict:
     obrazy: list[ObrazSceny] = []
     koszt_obrazy = 0.0
 
-    # Generuj obrazy równolegle (max 3 naraz — limit API)
-    for i in range(0, len(sceny_do_generacji), 3):
-        partia = sceny_do_generacji[i:i + 3]
-        zadania = []
+    # Wszystkie obrazy (sceny + miniaturka) w jednym gather — semafor trzyma
+    # max 3 wywołania DALL-E naraz (limit API), ale bez barier między partiami
+    semafor = asyncio.Semaphore(MAKS_ROWNOLEGLYCH_OBRAZOW)
+
+    # Identyczne prompty (powtórzone opisy scen, miniaturka = hak) → jedno
+    # wywołanie DALL-E; kolejne sceny kopiują plik pierwszej generacji
+    generacje_promptow: dict[str, asyncio.Future[tuple[bool, str, float]]] = {}
+
+    async def _generuj(prompt: str, sciezka: Path, numer: int) -> tuple[bool, str, float]:
+        async with semafor:
+            return await generuj_obraz_sceny(klient, prompt, sciezka, numer)
+
+    async def _kopiuj_wynik(
+        pierwsza: asyncio.Future[tuple[bool, str, float]], sciezka: Path
+    ) -> tuple[bool, str, float]:
+        # Koszt liczy tylko zadanie-właściciel promptu — kopia jest darmowa
+        sukces, zrodlo, _ = await asyncio.shield(pierwsza)
+        if not sukces:
+            return False, "", 0.0
+        await asyncio.to_thread(shutil.copyfile, zrodlo, sciezka)
+        return True, str(sciezka), 0.0
+
+    def generuj_z_limitem(
+        prompt: str, sciezka: Path, numer: int
+    ) -> Awaitable[tuple[bool, str, float]]:
+        pierwsza = generacje_promptow.get(prompt)
+        if pierwsza is not None:
+            return _kopiuj_wynik(pierwsza, sciezka)
+        zadanie = asyncio.ensure_future(_generuj(prompt, sciezka, numer))
+        generacje_promptow[prompt] = zadanie
+        return zadanie
+
+    zadania = []
+    for scena in sceny_do_generacji:
+        prompt = zoptymalizuj_prompt(
+            opis_sceny=scena["opis_wizualny"],
+            styl_wizualny=styl_wizualny,
+            emocja=scena["emocja"],
+            marka=marka,
+        )
+        sciezka = katalog_obrazy / f"scena_{scena['numer']:02d}.png"
+        zadania.append((scena, prompt, generuj_z_limitem(prompt, sciezka, scena["numer"])))
 
-        for scena in partia:
-            prompt = zoptymalizuj_prompt(
+    # Miniaturka nie zależy od obrazów scen — generowana w tej samej rundzie
+    zadanie_miniatury = None
+    if wszystkie_sceny:
+        prompt_miniatury = zoptymalizuj_prompt(
+            opis_sceny=plan.get("hak_wizualny", wszystkie_sceny[0]["opis_wizualny"]),
+            styl_wizualny=styl_wizualny,
+            emocja="zaskoczenie",
+            marka=marka,
+        )
+        zadanie_miniatury = generuj_z_limitem(
+            prompt_miniatury, katalog_obrazy / "miniaturka.png", 0
+        )
+
+    # [INNOWACJA 7] Guard spójności porównuje OPISY scen (nie obrazy),
+    # więc embeddingi liczą się równolegle z generacją (<2 scen → [])
+    zadanie_spojnosci = sprawdz_spojnosc_wizualna(klient, sceny_do_generacji)
+
+    wyniki = await asyncio.gather(
+        *[z[2] for z in zadania],
+        *([zadanie_miniatury] if zadanie_miniatury else []),
+        zadanie_spojnosci,
+        return_exceptions=True,
+    )
+    outliery = wyniki[-1]
+    if isinstance(outliery, Exception):
+        outliery = []
+    if zadanie_miniatury:
+        wynik_miniatury = wyniki[len(zadania)]
+        if not isinstance(wynik_miniatury, Exception):
+            koszt_obrazy += wynik_miniatury[2]
+
+    for (scena, prompt, _), wynik in zip(zadania, wyniki):
+        if isinstance(wynik, Exception):
+            log.error("Błąd obrazu sceny", numer=scena["numer"], blad=str(wynik))
+            continue
+
+        sukces, sciezka_pliku, koszt = wynik
+        koszt_obrazy += koszt
+        if sukces:
+            obrazy.append(ObrazSceny(
+                numer_sceny=scena["numer"],
+                sciezka_pliku=sciezka_pliku,
+                prompt_uzyty=prompt,
+                rozdzielczosc="1024x1792",
+                format="png",
+            ))
+
+    # ── [INNOWACJA 7] Regeneracja outlierów (równolegle) ───────────
+    if outliery:
+        log.info("Regeneruję niespójne sceny", outliery=outliery)
+        styl_ref = ekstrakcja_stylu_dominujacego(sceny_do_generacji)
+
+        regeneracje = []
+        for idx_outliera in outliery:
+            if idx_outliera >= len(sceny_do_generacji):
+                continue
+
+            scena = sceny_do_generacji[idx_outliera]
+            prompt_spojny = zoptymalizuj_prompt(
                 opis_sceny=scena["opis_wizualny"],
                 styl_wizualny=styl_wizualny,
                 emocja=scena["emocja"],
                 marka=marka,
+                styl_referencyjny=styl_ref,
             )
-            sciezka = katalog_obrazy / f"scena_{scena['numer']:02d}.png"
-            zadanie = generuj_obraz_sceny(klient, prompt, sciezka, scena["numer"])
-            zadania.append((scena, prompt, zadanie))
-
-        wyniki = await asyncio.gather(*[z[2] for z in zadania], return_exceptions=True)
+            sciezka = katalog_obrazy / f"scena_{scena['numer']:02d}_spojny.png"
+            regeneracje.append((
+                scena, prompt_spojny,
+                generuj_z_limitem(prompt_spojny, sciezka, scena["numer"]),
+            ))
+
+        wyniki_regeneracji = await asyncio.gather(
+            *[r[2] for r in regeneracje], return_exceptions=True
+        )
 
-        for (scena, prompt, _), wynik in zip(zadania, wyniki):
+        for (scena, prompt_spojny, _), wynik in zip(regeneracje, wyniki_regeneracji):
             if isinstance(wynik, Exception):
-                log.error("Błąd obrazu sceny", numer=scena["numer"], blad=str(wynik))
+                continue
+            koszt_obrazy += wynik[2]
+            if not wynik[0]:
                 continue
 
-            sukces, sciezka_pliku = wynik
-            if sukces:
-                obrazy.append(ObrazSceny(
-                    numer_sceny=scena["numer"],
-                    sciezka_pliku=sciezka_pliku,
-                    prompt_uzyty=prompt,
-                    rozdzielczosc="1024x1792",
-                    format="png",
-                ))
-                koszt_obrazy += 0.040
-
-    # ── [INNOWACJA 7] Guard spójności wizualnej ────────────────────
-    if len(sceny_do_generacji) >= 2:
-        outliery = await sprawdz_spojnosc_wizualna(klient, sceny_do_generacji)
-
-        if outliery:
-            log.info("Regeneruję niespójne sceny", outliery=outliery)
-            styl_ref = ekstrakcja_stylu_dominujacego(sceny_do_generacji)
-
-            for idx_outliera in outliery:
-                if idx_outliera >= len(sceny_do_generacji):
-                    continue
-
-                scena = sceny_do_generacji[idx_outliera]
-                prompt_spojny = zoptymalizuj_prompt(
-                    opis_sceny=scena["opis_wizualny"],
-                    styl_wizualny=styl_wizualny,
-                    emocja=scena["emocja"],
-                    marka=marka,
-                    styl_referencyjny=styl_ref,
-                )
-
-                sciezka = katalog_obrazy / f"scena_{scena['numer']:02d}_spojny.png"
-                sukces, sciezka_pliku = await generuj_obraz_sceny(
-                    klient, prompt_spojny, sciezka, scena["numer"]
-                )
-
-                if sukces:
-                    koszt_obrazy += 0.040
-                    # Zastąp stary obraz spójnym
-                    for j, obr in enumerate(obrazy):
-                        if obr["numer_sceny"] == scena["numer"]:
-                            obrazy[j] = ObrazSceny(
-                                numer_sceny=scena["numer"],
-                                sciezka_pliku=sciezka_pliku,
-                                prompt_uzyty=prompt_spojny,
-                                rozdzielczosc="1024x1792",
-                                format="png",
-                            )
-                            log.info("Scena regenerowana dla spójności", numer=scena["numer"])
-                            break
-
-    # Generuj miniaturkę
-    if wszystkie_sceny:
-        prompt_miniatury = zoptymalizuj_prompt(
-            opis_sceny=plan.get("hak_wizualny", wszystkie_sceny[0]["opis_wizualny"]),
-            styl_wizualny=styl_wizualny,
-            emocja="zaskoczenie",
-            marka=marka,
-        )
-        sciezka_miniatury = katalog_obrazy / "miniaturka.png"
-        sukces_min, _ = await generuj_obraz_sceny(
-            klient, prompt_miniatury, sciezka_miniatury, 0
-        )
-        if sukces_min:
-            koszt_obrazy += 0.040
+            # Zastąp stary obraz spójnym
+            for j, obr in enumerate(obrazy):
+                if obr["numer_sceny"] == scena["numer"]:
+                    obrazy[j] = ObrazSceny(
+                        numer_sceny=scena["numer"],
+                        sciezka_pliku=wynik[1],
+                        prompt_uzyty=prompt_spojny,
+                        rozdzielczosc="1024x1792",
+                        format="png",
+                    )
+                    log.info("Scena regenerowana dla spójności", numer=scena["numer"])
+                    break
 
     wizualia: WizualiaWideo = {
         "obrazy": obrazy,
@@ -17,10 +17,16 @@ Nowości v2.0:
 """
 
 import os
-import json
+import shutil
 import asyncio
+import hashlib
+import httpx
+import orjson
 import structlog
+from functools import lru_cache
 from pathlib import Path
+from typing import AsyncIterator
+from uuid import uuid4
 from openai import AsyncOpenAI
 
 from konfiguracja import konf
@@ -81,19 +87,104 @@ TEMPO_DO_WSPOLCZYNNIKA = {
     "szybkie":  1.08,
 }
 
+
+def _ogranicz_predkosc(predkosc: float) -> float:
+    # Bezpieczny zakres dla TTS-1 (unikamy skrajności)
+    return round(max(0.85, min(1.15, predkosc)), 2)
+
+
+# Gotowa tablica (emocja, tempo) → prędkość — jedno wyszukiwanie per scena
+# zamiast dwóch słowników, mnożenia i clampu przy każdym wywołaniu
+PREDKOSC_TTS = {
+    (emocja, tempo): _ogranicz_predkosc(baza * wspolczynnik)
+    for emocja, baza in EMOCJA_DO_TEMPA.items()
+    for tempo, wspolczynnik in TEMPO_DO_WSPOLCZYNNIKA.items()
+}
+
 # Max 6 słów na jeden segment karaoke (fit na ekranie mobilnym)
 MAKS_SLOW_NA_SEGMENT_KARAOKE = 6
 
+# Cennik OpenAI przeliczony raz: tts-1 $15/1M znaków, tts-1-hd $30/1M,
+# whisper-1 $0.006/min
+KOSZT_TTS_ZA_ZNAK_USD = 15 / 1_000_000
+KOSZT_TTS_HD_ZA_ZNAK_USD = 30 / 1_000_000
+KOSZT_WHISPER_ZA_SEKUNDE_USD = 0.006 / 60
+
 
 # ====================================================================
-# FUNKCJE POMOCNICZE
+# KLIENT OPENAI (współdzielony)
 # ====================================================================
 
-def wybierz_glos(plan_tresci: dict) -> str:
-    """Dobiera optymalny głos na podstawie tonu i platformy."""
-    ton = plan_tresci.get("ton_glosu", "energiczny").lower()
-    platforma = plan_tresci.get("platforma_docelowa", ["tiktok"])[0]
+# Pula połączeń dla fan-outu scen: wiele małych POST-ów do jednego hosta
+LIMITY_POLACZEN_TTS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=20,
+    keepalive_expiry=75.0,
+)
+TIMEOUT_TTS = httpx.Timeout(60.0, connect=5.0)
+
+_klient_tts: AsyncOpenAI | None = None
+_petla_klienta_tts: asyncio.AbstractEventLoop | None = None
+
+
+def pobierz_klienta_tts() -> AsyncOpenAI:
+    """
+    Zwraca współdzielonego klienta OpenAI dla TTS i Whispera.
+
+    Jeden klient = jedna pula połączeń keep-alive: kolejne syntezy nie płacą
+    za nowy handshake TCP+TLS. Klient jest przypięty do pętli zdarzeń —
+    worker Celery tworzy nową pętlę per zadanie, więc wtedy powstaje nowy klient.
+    """
+    global _klient_tts, _petla_klienta_tts
+    petla = asyncio.get_running_loop()
+    if _klient_tts is None or _petla_klienta_tts is not petla:
+        _klient_tts = AsyncOpenAI(
+            api_key=konf.OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                limits=LIMITY_POLACZEN_TTS,
+                timeout=TIMEOUT_TTS,
+            ),
+        )
+        _petla_klienta_tts = petla
+    return _klient_tts
+
+
+_semafor_tts: asyncio.Semaphore | None = None
+_petla_semafora_tts: asyncio.AbstractEventLoop | None = None
+
+
+def pobierz_semafor_tts() -> asyncio.Semaphore:
+    """
+    Zwraca semafor ograniczający równoległe syntezy TTS (konf.MAKS_ROWNOLEGLYCH_TTS).
 
+    Wideo z wieloma scenami + równoległe zadania nie otwierają setek żądań
+    naraz — zamiast fali 429 i ponowień, stała liczba syntez w locie.
+    Jak klient: przypięty do pętli zdarzeń, odtwarzany przy nowej pętli.
+    """
+    global _semafor_tts, _petla_semafora_tts
+    petla = asyncio.get_running_loop()
+    if _semafor_tts is None or _petla_semafora_tts is not petla:
+        _semafor_tts = asyncio.Semaphore(konf.MAKS_ROWNOLEGLYCH_TTS)
+        _petla_semafora_tts = petla
+    return _semafor_tts
+
+
+async def zamknij_klienta_tts() -> None:
+    """Zamyka współdzielonego klienta TTS (shutdown aplikacji)."""
+    global _klient_tts, _petla_klienta_tts
+    if _klient_tts is not None:
+        await _klient_tts.close()
+    _klient_tts = None
+    _petla_klienta_tts = None
+
+
+# ====================================================================
+# FUNKCJE POMOCNICZE
+# ====================================================================
+
+@lru_cache(maxsize=256)
+def _glos_dla_tonu(ton: str, platforma: str) -> str:
+    """Skan podciągów tonu — wynik zależy tylko od (ton, platforma), więc cache."""
     for emocja, glos in GLOSY_PER_EMOCJE.items():
         if emocja in ton:
             return glos
@@ -101,6 +192,13 @@ def wybierz_glos(plan_tresci: dict) -> str:
     return GLOSY_PER_PLATFORMA.get(platforma, konf.DOMYSLNY_GLOS)
 
 
+def wybierz_glos(plan_tresci: dict) -> str:
+    """Dobiera optymalny głos na podstawie tonu i platformy."""
+    ton = plan_tresci.get("ton_glosu", "energiczny").lower()
+    platforma = plan_tresci.get("platforma_docelowa", ["tiktok"])[0]
+    return _glos_dla_tonu(ton, platforma)
+
+
 def oblicz_predkosc_tts(emocja: str, tempo: str) -> float:
     """
     Oblicza optymalną prędkość TTS na podstawie emocji i tempa sceny.
@@ -108,11 +206,14 @@ def oblicz_predkosc_tts(emocja: str, tempo: str) -> float:
     Mapuje emocje i tempo scenariusza na parametr speed OpenAI TTS.
     Każda scena ma indywidualną prędkość zamiast monotonnego 1.0.
     """
-    baza = EMOCJA_DO_TEMPA.get(emocja.lower(), 1.00)
-    wspolczynnik = TEMPO_DO_WSPOLCZYNNIKA.get(tempo.lower(), 1.00)
-    predkosc = baza * wspolczynnik
-    # Bezpieczny zakres dla TTS-1 (unikamy skrajności)
-    return round(max(0.85, min(1.15, predkosc)), 2)
+    emocja, tempo = emocja.lower(), tempo.lower()
+    predkosc = PREDKOSC_TTS.get((emocja, tempo))
+    if predkosc is None:
+        # Emocja/tempo spoza mapowań — bazowe 1.00 dla nieznanej składowej
+        predkosc = _ogranicz_predkosc(
+            EMOCJA_DO_TEMPA.get(emocja, 1.00) * TEMPO_DO_WSPOLCZYNNIKA.get(tempo, 1.00)
+        )
+    return predkosc
 
 
 def wstrzyknij_pauzy_dramatyczne(tekst: str, emocja: str, tempo: str) -> str:
@@ -146,14 +247,15 @@ async def mierz_czas_mp3(sciezka: str) -> float:
         proc = await asyncio.create_subprocess_exec(
             "ffprobe", "-v", "quiet",
             "-print_format", "json",
-            "-show_streams",
+            # Tylko pola czytane poniżej — mniejszy JSON do sparsowania
+            "-show_entries", "stream=codec_type,duration",
             sciezka,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
         stdout, _ = await proc.communicate()
         if proc.returncode == 0:
-            dane = json.loads(stdout.decode())
+            dane = orjson.loads(stdout)
             for stream in dane.get("streams", []):
                 if stream.get("codec_type") == "audio":
                     return float(stream.get("duration", 0.0))
@@ -231,10 +333,108 @@ def grupuj_slowa_w_segmenty_karaoke(
     return segmenty
 
 
+# ====================================================================
+# CACHE SYNTEZY (content-addressed)
+# ====================================================================
+
+# Intra, CTA i powtórzone sceny przy retry mają identyczny tekst — nie płacimy drugi raz
+KATALOG_CACHE_TTS = Path(konf.SCIEZKA_TYMCZASOWA) / "cache" / "tts"
+
+
+def klucz_cache_tts(model: str, glos: str, predkosc: float, tekst: str) -> str:
+    """Zwraca klucz SHA-256 dla (model, głos, prędkość, tekst) syntezy."""
+    skrot = hashlib.sha256(f"{model}|{glos}|{predkosc:.2f}|".encode())
+    skrot.update(tekst.encode("utf-8"))
+    return skrot.hexdigest()
+
+
+def _sciezka_cache_tts(klucz: str) -> Path:
+    return KATALOG_CACHE_TTS / klucz[:2] / f"{klucz}.mp3"
+
+
+def _zapisz_w_cache_tts(zrodlo: Path, klucz: str) -> None:
+    """Kopiuje wynik syntezy do cache (atomowo: plik tymczasowy + os.replace)."""
+    cel = _sciezka_cache_tts(klucz)
+    # Unikalny per zapis — równoległe zapisy tego samego klucza (także
+    # w jednym procesie) nie nadpisują sobie pliku tymczasowego
+    tymczasowy = cel.with_suffix(f".{uuid4().hex}.tmp")
+    try:
+        cel.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(zrodlo, tymczasowy)
+        os.replace(tymczasowy, cel)
+    except OSError as e:
+        tymczasowy.unlink(missing_ok=True)
+        logger.debug("Nie udało się zapisać audio w cache", blad=str(e))
+
+
 # ====================================================================
 # GENERACJA AUDIO
 # ====================================================================
 
+# Rozmiar fragmentu strumienia MP3 — pamięć per żądanie = jeden fragment
+ROZMIAR_FRAGMENTU_AUDIO = 64 * 1024
+
+
+async def strumieniuj_audio(
+    klient: AsyncOpenAI,
+    tekst: str,
+    glos: str,
+    predkosc: float = 1.0,
+    model: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Syntezuje mowę i zwraca MP3 fragmentami, w miarę jak przychodzą z API.
+
+    Wywołujący (plik, HTTP, WebSocket) dostaje pierwszy fragment po TTFB,
+    bez buforowania całego klipu w pamięci.
+    """
+    async with klient.audio.speech.with_streaming_response.create(
+        model=model or konf.MODEL_GLOS,
+        voice=glos,
+        input=tekst,
+        response_format="mp3",
+        speed=predkosc,
+    ) as odpowiedz:
+        async for fragment in odpowiedz.iter_bytes(ROZMIAR_FRAGMENTU_AUDIO):
+            yield fragment
+
+
+# Syntezy w toku per klucz cache — równoległe żądania o identyczny klip
+# dołączają do trwającego zadania (wpis usuwany po jego zakończeniu)
+_syntezy_w_toku: dict[str, asyncio.Future[Path]] = {}
+
+
+async def _syntezuj_do_pliku(
+    klient: AsyncOpenAI,
+    tekst: str,
+    glos: str,
+    predkosc: float,
+    model: str,
+    sciezka: Path,
+    klucz: str,
+) -> Path:
+    """
+    Strumieniuje syntezę do pliku, zapisuje ją w cache i zwraca ścieżkę.
+
+    Fragmenty trafiają do pliku .part, podmienianego atomowo po ostatnim —
+    przerwany strumień nie zostawia uciętego MP3 dla ffprobe/kompozytora.
+    """
+    czesciowy = sciezka.with_suffix(sciezka.suffix + ".part")
+    try:
+        async with pobierz_semafor_tts():
+            with open(czesciowy, "wb") as plik:
+                async for fragment in strumieniuj_audio(klient, tekst, glos, predkosc, model):
+                    plik.write(fragment)
+        os.replace(czesciowy, sciezka)
+    except BaseException:
+        # Także przy anulowaniu (Runner zadania Celery anuluje wiszące zadania)
+        czesciowy.unlink(missing_ok=True)
+        raise
+
+    await asyncio.to_thread(_zapisz_w_cache_tts, sciezka, klucz)
+    return sciezka
+
+
 async def generuj_audio_sceny(
     klient: AsyncOpenAI,
     tekst: str,
@@ -243,16 +443,20 @@ async def generuj_audio_sceny(
     emocja: str = "neutralna",
     tempo: str = "normalne",
     hd: bool = False,
-) -> bool:
+) -> tuple[bool, float]:
     """
     Generuje audio dla jednej sceny z emocjonalnym dostrojeniem tempa.
 
     Nowość vs v1.0:
     - speed param dobierany per scena (emocja + tempo)
     - Pauzy dramatyczne przez "..."
+
+    Returns:
+        (sukces, koszt_usd) — koszt 0 przy trafieniu w cache i przy
+        dołączeniu do identycznej syntezy już w toku
     """
     if not tekst.strip():
-        return False
+        return False, 0.0
 
     model_tts = konf.MODEL_GLOS_HD if hd else konf.MODEL_GLOS
 
@@ -260,19 +464,33 @@ async def generuj_audio_sceny(
     tekst_z_pauzami = wstrzyknij_pauzy_dramatyczne(tekst, emocja, tempo)
     predkosc = oblicz_predkosc_tts(emocja, tempo)
 
-    odpowiedz = await klient.audio.speech.create(
-        model=model_tts,
-        voice=glos,
-        input=tekst_z_pauzami,
-        response_format="mp3",
-        speed=predkosc,
-    )
-
+    klucz = klucz_cache_tts(model_tts, glos, predkosc, tekst_z_pauzami)
+    sciezka_cache = _sciezka_cache_tts(klucz)
     sciezka.parent.mkdir(parents=True, exist_ok=True)
-    with open(sciezka, "wb") as plik:
-        plik.write(odpowiedz.content)
-
-    return True
+    if sciezka_cache.exists():
+        # Kopia pliku (MB) poza pętlą zdarzeń — równoległe sceny nie czekają
+        await asyncio.to_thread(shutil.copyfile, sciezka_cache, sciezka)
+        return True, 0.0
+
+    # Ta sama synteza już w toku (np. identyczne CTA w równoległych scenach)?
+    # Czekamy na jej wynik zamiast płacić za drugie wywołanie API
+    koszt = 0.0
+    zadanie = _syntezy_w_toku.get(klucz)
+    if zadanie is None:
+        zadanie = asyncio.ensure_future(_syntezuj_do_pliku(
+            klient, tekst_z_pauzami, glos, predkosc, model_tts, sciezka, klucz
+        ))
+        _syntezy_w_toku[klucz] = zadanie
+        zadanie.add_done_callback(lambda _: _syntezy_w_toku.pop(klucz, None))
+        # Płaci tylko wywołujący, który faktycznie zlecił syntezę
+        stawka = KOSZT_TTS_HD_ZA_ZNAK_USD if hd else KOSZT_TTS_ZA_ZNAK_USD
+        koszt = len(tekst_z_pauzami) * stawka
+
+    # shield: anulowanie jednego oczekującego nie przerywa syntezy pozostałym
+    sciezka_zrodla = await asyncio.shield(zadanie)
+    if sciezka_zrodla != sciezka:
+        await asyncio.to_thread(shutil.copyfile, sciezka_zrodla, sciezka)
+    return True, koszt
 
 
 # ====================================================================
@@ -301,22 +519,24 @@ async def rezyser_glosu(stan: StanNEXUS) -> dict:
     plan = stan.get("plan_tresci", {})
     log.info("Reżyser Głosu v2.0 generuje narrację", sceny=len(scenariusz["sceny"]))
 
-    klient = AsyncOpenAI(api_key=konf.OPENAI_API_KEY)
+    klient = pobierz_klienta_tts()
     glos = wybierz_glos(plan)
 
     sesja_id = stan.get("metadane", {}).get("sesja_id", "domyslna")
     katalog_audio = Path(konf.SCIEZKA_TYMCZASOWA) / sesja_id / "audio"
     katalog_audio.mkdir(parents=True, exist_ok=True)
 
+    # Sceny z narracją indeksowane numerem — tekst normalizowany raz,
+    # kolejne etapy (synteza, fallback czasu, segmenty) tylko odczytują
+    sceny_z_narracja = {
+        s["numer"]: s for s in scenariusz["sceny"] if s["tekst_narracji"].strip()
+    }
+
     # Pełny tekst (cała narracja złączona)
-    pelny_tekst = " ".join(
-        s["tekst_narracji"]
-        for s in scenariusz["sceny"]
-        if s["tekst_narracji"].strip()
-    )
+    pelny_tekst = " ".join(s["tekst_narracji"] for s in sceny_z_narracja.values())
+    szacunek_czasu = len(pelny_tekst.split()) / 150 * 60
 
     liczba_znakow = len(pelny_tekst)
-    koszt_tts = liczba_znakow * 15 / 1_000_000
 
     sciezka_pelne = katalog_audio / "narracja_pelna.mp3"
 
@@ -328,75 +548,86 @@ async def rezyser_glosu(stan: StanNEXUS) -> dict:
             emocja_glowna = scenariusz["sceny"][0].get("emocja", "inspiracja")
             tempo_glowne = scenariusz["sceny"][0].get("tempo", "normalne")
 
-        sukces = await generuj_audio_sceny(
-            klient=klient,
-            tekst=pelny_tekst,
-            glos=glos,
-            sciezka=sciezka_pelne,
-            emocja=emocja_glowna,
-            tempo=tempo_glowne,
+        # Segmenty per scena — z emocjonalnym tempem per scena
+        zadania_scen = []
+        for numer, scena in sceny_z_narracja.items():
+            sciezka_sceny = katalog_audio / f"scena_{numer:02d}.mp3"
+            zadanie = generuj_audio_sceny(
+                klient=klient,
+                tekst=scena["tekst_narracji"],
+                glos=glos,
+                sciezka=sciezka_sceny,
+                emocja=scena.get("emocja", "neutralna"),
+                tempo=scena.get("tempo", "normalne"),
+            )
+            zadania_scen.append((numer, sciezka_sceny, zadanie))
+
+        # Pełna narracja i segmenty scen są niezależne — jeden gather zamiast
+        # dwóch kolejnych rund: czas ≈ max(pojedyncza synteza), nie suma
+        wyniki_syntezy = await asyncio.gather(
+            generuj_audio_sceny(
+                klient=klient,
+                tekst=pelny_tekst,
+                glos=glos,
+                sciezka=sciezka_pelne,
+                emocja=emocja_glowna,
+                tempo=tempo_glowne,
+            ),
+            *[z[2] for z in zadania_scen],
+            return_exceptions=True,
+        )
+        # Koszt tylko faktycznych wywołań API (cache i syntezy współdzielone = 0)
+        koszt_scen = sum(
+            w[1] for w in wyniki_syntezy[1:] if not isinstance(w, BaseException)
         )
 
-        if not sukces:
+        wynik_pelny = wyniki_syntezy[0]
+        if isinstance(wynik_pelny, BaseException) or not wynik_pelny[0]:
+            # Segmenty scen syntezowały się równolegle i są już opłacone —
+            # ich koszt trafia do raportu także przy błędzie pełnej narracji
+            blad = (
+                str(wynik_pelny) if isinstance(wynik_pelny, BaseException)
+                else "błąd generacji audio"
+            )
+            log.error("Błąd Reżysera Głosu v2.0", blad=blad)
             return {
-                "bledy": ["Reżyser Głosu: błąd generacji audio"],
+                "bledy": [f"Reżyser Głosu: {blad}"],
                 "krok_aktualny": "blad_rezysera",
+                "koszt_calkowity_usd": stan.get("koszt_calkowity_usd", 0.0) + koszt_scen,
             }
 
+        koszt_tts = wynik_pelny[1] + koszt_scen
+
         # ── [BUG #1 NAPRAWA] Zmierz rzeczywisty czas MP3 ─────────────────
-        czas_trwania = await mierz_czas_mp3(str(sciezka_pelne))
+        # Whisper i wszystkie pomiary ffprobe wysyłane jedną partią —
+        # niezależne podprocesy/żądania nie czekają na siebie nawzajem
+        znaczniki_slow, czas_trwania, *czasy_scen = await asyncio.gather(
+            pobierz_znaczniki_slow(klient, str(sciezka_pelne)),
+            mierz_czas_mp3(str(sciezka_pelne)),
+            *[mierz_czas_mp3(str(z[1])) for z in zadania_scen],
+        )
         if czas_trwania <= 0:
             # Fallback na szacunek jeśli ffprobe niedostępne
-            czas_trwania = len(pelny_tekst.split()) / 150 * 60
+            czas_trwania = szacunek_czasu
             log.warning("ffprobe niedostępne — używam szacunku czasu (A/V drift możliwy!)")
         else:
             log.info(
                 "Rzeczywisty czas MP3 zmierzony przez ffprobe",
                 czas_s=round(czas_trwania, 2),
-                szacunek_s=round(len(pelny_tekst.split()) / 150 * 60, 2),
-                roznica_s=round(czas_trwania - len(pelny_tekst.split()) / 150 * 60, 2),
+                szacunek_s=round(szacunek_czasu, 2),
+                roznica_s=round(czas_trwania - szacunek_czasu, 2),
             )
 
-        # Generuj segmenty per scena równolegle — z emocjonalnym tempem per scena
-        zadania_scen = []
-        for scena in scenariusz["sceny"]:
-            if scena["tekst_narracji"].strip():
-                sciezka_sceny = katalog_audio / f"scena_{scena['numer']:02d}.mp3"
-                zadanie = generuj_audio_sceny(
-                    klient=klient,
-                    tekst=scena["tekst_narracji"],
-                    glos=glos,
-                    sciezka=sciezka_sceny,
-                    emocja=scena.get("emocja", "neutralna"),
-                    tempo=scena.get("tempo", "normalne"),
-                )
-                zadania_scen.append((scena["numer"], sciezka_sceny, zadanie))
-
-        if zadania_scen:
-            await asyncio.gather(*[z[2] for z in zadania_scen], return_exceptions=True)
-            koszt_tts += liczba_znakow * 0.3 * 15 / 1_000_000
-
         # ── [BUG #1 NAPRAWA] Zmierz czasy per scena przez ffprobe ────────
         # Buduj segmenty z REALNYCH czasów każdego pliku sceny
         segmenty_realne = []
         czas_aktualny = 0.0
 
-        for numer_sceny, sciezka_sceny, _ in zadania_scen:
-            czas_sceny = await mierz_czas_mp3(str(sciezka_sceny))
+        for (numer_sceny, _, _), czas_sceny in zip(zadania_scen, czasy_scen):
+            tekst_sceny = sceny_z_narracja[numer_sceny]["tekst_narracji"]
             if czas_sceny <= 0:
                 # Fallback proporcjonalny per scena
-                scena_obj = next(
-                    (s for s in scenariusz["sceny"] if s["numer"] == numer_sceny), None
-                )
-                if scena_obj:
-                    czas_sceny = len(scena_obj["tekst_narracji"].split()) / 150 * 60
-                else:
-                    czas_sceny = 3.0
-
-            scena_obj = next(
-                (s for s in scenariusz["sceny"] if s["numer"] == numer_sceny), None
-            )
-            tekst_sceny = scena_obj["tekst_narracji"] if scena_obj else ""
+                czas_sceny = len(tekst_sceny.split()) / 150 * 60
 
             segmenty_realne.append({
                 "numer": numer_sceny,
@@ -407,10 +638,8 @@ async def rezyser_glosu(stan: StanNEXUS) -> dict:
             czas_aktualny += czas_sceny
 
         # ── [INNOWACJA 2] Whisper word-timestamps dla prawdziwego karaoke ──
-        znaczniki_slow = await pobierz_znaczniki_slow(klient, str(sciezka_pelne))
-
         # Koszt Whispera: $0.006/minutę
-        koszt_whisper = (czas_trwania / 60.0) * 0.006
+        koszt_whisper = czas_trwania * KOSZT_WHISPER_ZA_SEKUNDE_USD
         koszt_tts += koszt_whisper
 
         segmenty_karaoke = grupuj_slowa_w_segmenty_karaoke(znaczniki_slow)
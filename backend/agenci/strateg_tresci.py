@@ -48,11 +48,17 @@ Twoja misja: transformować dowolny brief w precyzyjny plan treści oparty na na
 Odpowiadaj WYŁĄCZNIE w formacie JSON. Bądź precyzyjny i kreatywny."""
 
 
+# Kontekst marki jako osobna wiadomość systemowa zaraz za SYSTEM_STRATEG —
+# prefiks promptu jest identyczny dla kolejnych briefów tej samej marki,
+# więc automatyczny prompt caching OpenAI (prefiks >= 1024 tokenów)
+# nalicza go po stawce cache zamiast pełnego prefillu
+PROMPT_KONTEKSTU_MARKI = """Kontekst marki: {kontekst_marki}
+Profil marki: {marka}"""
+
+
 PROMPT_PLANU = """
 Brief użytkownika: {brief}
 
-Kontekst marki: {kontekst_marki}
-Profil marki: {marka}
 Platformy docelowe: {platforma}
 
 Stwórz strategiczny plan treści. Odpowiedz w JSON:
@@ -89,10 +95,12 @@ async def strateg_tresci(stan: StanNEXUS) -> dict:
 
     klient = AsyncOpenAI(api_key=konf.OPENAI_API_KEY)
 
+    kontekst = PROMPT_KONTEKSTU_MARKI.format(
+        kontekst_marki=stan.get("kontekst_marki", "Brak profilu marki — twórz neutralnie"),
+        marka=json.dumps(stan.get("marka", {}), ensure_ascii=False, sort_keys=True),
+    )
     prompt = PROMPT_PLANU.format(
         brief=stan["brief"],
-        kontekst_marki=stan.get("kontekst_marki", "Brak profilu marki — twórz neutralnie"),
-        marka=json.dumps(stan.get("marka", {}), ensure_ascii=False),
         platforma=", ".join(stan.get("platforma", ["tiktok", "youtube"]))
     )
 
@@ -101,6 +109,7 @@ async def strateg_tresci(stan: StanNEXUS) -> dict:
             model=konf.MODEL_EKONOMICZNY,  # gpt-4o-mini — wystarczający dla planu
             messages=[
                 {"role": "system", "content": SYSTEM_STRATEG},
+                {"role": "system", "content": kontekst},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.8,            # Kreatywność przy planowaniu
@@ -28,6 +28,7 @@ Model NVS (NEXUS Viral Score):
 """
 
 import json
+import orjson
 import structlog
 from pathlib import Path
 from openai import AsyncOpenAI
@@ -79,7 +80,7 @@ class KalibracjaNVS:
     def _wczytaj(self) -> dict:
         if self._sciezka.exists():
             try:
-                return json.loads(self._sciezka.read_text(encoding="utf-8"))
+                return orjson.loads(self._sciezka.read_bytes())
             except Exception:
                 pass
         return {
@@ -91,10 +92,7 @@ class KalibracjaNVS:
     def _zapisz(self) -> None:
         try:
             self._sciezka.parent.mkdir(parents=True, exist_ok=True)
-            self._sciezka.write_text(
-                json.dumps(self._dane, ensure_ascii=False, indent=2),
-                encoding="utf-8",
-            )
+            self._sciezka.write_bytes(orjson.dumps(self._dane, option=orjson.OPT_INDENT_2))
         except Exception as e:
             logger.warning("Błąd zapisu kalibracji NVS", blad=str(e))
 
@@ -129,16 +127,9 @@ class KalibracjaNVS:
 
         wagi = self._dane["wagi"]
         for klucz in wagi:
-            if klucz == "sila_haka":
-                val = komponenty.get("sila_haka", 70)
-            elif klucz == "retencja":
-                val = komponenty.get("retencja", 70)
-            elif klucz == "udostepnialnosc":
-                val = komponenty.get("udostepnialnosc", 70)
-            elif klucz == "optymalizacja_platformy":
-                val = komponenty.get("optymalizacja_platformy", 70)
-            else:
+            if klucz not in WAGI_NVS_DOMYSLNE:
                 continue
+            val = komponenty.get(klucz, 70)
             # Gradient step
             wagi[klucz] += lr * residual * (val - srednia_komp) / 100.0
 
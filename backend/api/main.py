@@ -15,6 +15,7 @@ Uruchomienie:
 
 import os
 import time
+import orjson
 import structlog
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
@@ -28,7 +29,11 @@ from prometheus_client import (
     multiprocess as prom_multiprocess,
 )
 
-from konfiguracja import pobierz_konfiguracje
+from konfiguracja import konf
+from agenci.orkiestrator import zamknij_redis_stanu
+from agenci.producent_wizualny import zamknij_klienta_pobierania
+from agenci.rezyser_glosu import zamknij_klienta_tts
+from rag.baza_wiedzy import zamknij_klienta_embeddingow
 from api.trasy.wideo import router as router_wideo
 from api.trasy.ws import router as router_ws
 from api.trasy.zadania import router as router_zadania
@@ -53,7 +58,6 @@ structlog.configure(
 )
 
 logger = structlog.get_logger(__name__)
-konf = pobierz_konfiguracje()
 
 
 @asynccontextmanager
@@ -74,6 +78,10 @@ async def lifespan(app: FastAPI):
     yield
 
     # Shutdown
+    await zamknij_klienta_tts()
+    await zamknij_klienta_pobierania()
+    await zamknij_redis_stanu()
+    await zamknij_klienta_embeddingow()
     logger.info("NEXUS zamyka się")
 
 
@@ -258,53 +266,59 @@ async def zdrowie():
     }
 
 
+# Katalog modeli jest statyczny — serializowany raz przy imporcie,
+# endpoint zwraca gotowe bajty (bez budowy dictów i kodowania per żądanie)
+KATALOG_MODELI = {
+    "modele": [
+        {
+            "id": "gpt-4o-mini",
+            "zastosowanie": ["strategia", "scenariusz", "wiralnosc"],
+            "koszt_input_1m": "$0.15",
+            "koszt_output_1m": "$0.60",
+            "optymalizacja": "90% zadań — najlepszy stosunek jakości do ceny",
+        },
+        {
+            "id": "gpt-4o",
+            "zastosowanie": ["recenzja_jakosci"],
+            "koszt_input_1m": "$2.50",
+            "koszt_output_1m": "$10.00",
+            "optymalizacja": "10% zadań — tylko krytyczne decyzje jakości",
+        },
+        {
+            "id": "dall-e-3",
+            "zastosowanie": ["generacja_obrazow", "miniaturka"],
+            "koszt_per_obraz": "$0.04 (standard) | $0.08 (HD)",
+            "rozdzielczosc": "1024x1792 (9:16 pionowy)",
+            "optymalizacja": "Max 5 obrazów/wideo dla optymalizacji kosztów",
+        },
+        {
+            "id": "tts-1",
+            "zastosowanie": ["narracja"],
+            "koszt_1m_znakow": "$15.00",
+            "glosy": ["nova", "alloy", "echo", "fable", "onyx", "shimmer"],
+            "optymalizacja": "tts-1 vs tts-1-hd: 2x tańszy, minimalna różnica jakości",
+        },
+        {
+            "id": "text-embedding-3-small",
+            "zastosowanie": ["rag_marka", "podobienstwo"],
+            "koszt_1m_tokenow": "$0.020",
+            "wymiary": 1536,
+            "optymalizacja": "Najtańszy embedding OpenAI, wystarczający dla RAG",
+        },
+    ],
+    "szacowany_koszt_per_wideo": {
+        "gpt_4o_mini_skrypty": "$0.001",
+        "dall_e_3_3_obrazy": "$0.120",
+        "tts_narracja": "$0.018",
+        "gpt_4o_recenzja": "$0.005",
+        "embeddingi_rag": "$0.001",
+        "total": "~$0.145",
+    }
+}
+_KATALOG_MODELI_JSON = orjson.dumps(KATALOG_MODELI)
+
+
 @app.get("/api/modele", summary="Lista dostępnych modeli", tags=["System"])
 async def lista_modeli():
     """Lista modeli OpenAI używanych przez NEXUS z kosztami."""
-    return {
-        "modele": [
-            {
-                "id": "gpt-4o-mini",
-                "zastosowanie": ["strategia", "scenariusz", "wiralnosc"],
-                "koszt_input_1m": "$0.15",
-                "koszt_output_1m": "$0.60",
-                "optymalizacja": "90% zadań — najlepszy stosunek jakości do ceny",
-            },
-            {
-                "id": "gpt-4o",
-                "zastosowanie": ["recenzja_jakosci"],
-                "koszt_input_1m": "$2.50",
-                "koszt_output_1m": "$10.00",
-                "optymalizacja": "10% zadań — tylko krytyczne decyzje jakości",
-            },
-            {
-                "id": "dall-e-3",
-                "zastosowanie": ["generacja_obrazow", "miniaturka"],
-                "koszt_per_obraz": "$0.04 (standard) | $0.08 (HD)",
-                "rozdzielczosc": "1024x1792 (9:16 pionowy)",
-                "optymalizacja": "Max 5 obrazów/wideo dla optymalizacji kosztów",
-            },
-            {
-                "id": "tts-1",
-                "zastosowanie": ["narracja"],
-                "koszt_1m_znakow": "$15.00",
-                "glosy": ["nova", "alloy", "echo", "fable", "onyx", "shimmer"],
-                "optymalizacja": "tts-1 vs tts-1-hd: 2x tańszy, minimalna różnica jakości",
-            },
-            {
-                "id": "text-embedding-3-small",
-                "zastosowanie": ["rag_marka", "podobienstwo"],
-                "koszt_1m_tokenow": "$0.020",
-                "wymiary": 1536,
-                "optymalizacja": "Najtańszy embedding OpenAI, wystarczający dla RAG",
-            },
-        ],
-        "szacowany_koszt_per_wideo": {
-            "gpt_4o_mini_skrypty": "$0.001",
-            "dall_e_3_3_obrazy": "$0.120",
-            "tts_narracja": "$0.018",
-            "gpt_4o_recenzja": "$0.005",
-            "embeddingi_rag": "$0.001",
-            "total": "~$0.145",
-        }
-    }
+    return Response(_KATALOG_MODELI_JSON, media_type="application/json")
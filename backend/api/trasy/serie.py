@@ -11,7 +11,7 @@ Endpointy:
 - DELETE /api/v1/serie/{seria_id}  — Usuń serię
 """
 
-import json
+import orjson
 import asyncio
 import structlog
 from pathlib import Path
@@ -37,7 +37,7 @@ def wczytaj_serie() -> dict[str, dict]:
     """Wczytuje bazę serii z pliku JSON."""
     if PLIK_SERII.exists():
         try:
-            return json.loads(PLIK_SERII.read_text(encoding="utf-8"))
+            return orjson.loads(PLIK_SERII.read_bytes())
         except Exception:
             return {}
     return {}
@@ -46,10 +46,7 @@ def wczytaj_serie() -> dict[str, dict]:
 def zapisz_serie(serie: dict[str, dict]) -> None:
     """Zapisuje bazę serii do pliku JSON."""
     PLIK_SERII.parent.mkdir(parents=True, exist_ok=True)
-    PLIK_SERII.write_text(
-        json.dumps(serie, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    PLIK_SERII.write_bytes(orjson.dumps(serie, option=orjson.OPT_INDENT_2))
 
 
 # ── SCHEMATY ŻĄDAŃ ──────────────────────────────────────────────────
@@ -14,11 +14,11 @@ Endpointy:
 import os
 import structlog
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks
 from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel, Field
 
-from konfiguracja import konf, pobierz_konfiguracje
+from konfiguracja import konf
 from agenci.orkiestrator import pobierz_orkiestratora
 from analityka.silnik_wiralnosci import analizuj_wiralnosc, oblicz_nwv_heurystyczny
 from rag.baza_wiedzy import pobierz_baze_wiedzy
@@ -125,13 +125,12 @@ Koszt szacunkowy: ~$0.14/wideo | Czas: ~90 sekund
 )
 async def generuj_wideo(
     zadanie: ZadanieGeneracji,
-    konfiguracja: pobierz_konfiguracje = Depends(pobierz_konfiguracje),
 ) -> OdpowiedzGeneracji:
     """Główny endpoint generacji wideo NEXUS."""
     log = logger.bind(endpoint="generuj_wideo")
     log.info("Nowe zadanie generacji", brief_dl=len(zadanie.brief))
 
-    if not konfiguracja.OPENAI_API_KEY:
+    if not konf.OPENAI_API_KEY:
         raise HTTPException(
             status_code=503,
             detail="Brak klucza OPENAI_API_KEY w konfiguracji"
@@ -191,7 +190,7 @@ async def generuj_wideo(
 async def pobierz_status(sesja_id: str) -> dict:
     """Sprawdza aktualny status sesji generacji."""
     orkiestrator = pobierz_orkiestratora()
-    return orkiestrator.pobierz_stan_sesji(sesja_id)
+    return await orkiestrator.pobierz_stan_sesji(sesja_id)
 
 
 @router.get(
@@ -21,6 +21,7 @@ Wiadomości JSON:
 
 import json
 import asyncio
+import orjson
 import structlog
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
@@ -30,6 +31,9 @@ logger = structlog.get_logger(__name__)
 
 router = APIRouter(tags=["WebSocket"])
 
+# Kroki kończące pipeline — po nich zamykamy WebSocket
+KROKI_KONCOWE = frozenset({"gotowe", "blad", "blad_krytyczny"})
+
 
 @router.websocket("/ws/wideo/{sesja_id}")
 async def websocket_postep(websocket: WebSocket, sesja_id: str):
@@ -65,37 +69,42 @@ async def websocket_postep(websocket: WebSocket, sesja_id: str):
 
         try:
             # Nasłuchuj przez max 600s
-            timeout = 600
-            czas_start = asyncio.get_event_loop().time()
-
-            while (asyncio.get_event_loop().time() - czas_start) < timeout:
-                try:
-                    wiadomosc = await asyncio.wait_for(
-                        pubsub.get_message(ignore_subscribe_messages=True),
-                        timeout=1.0,
-                    )
-                except asyncio.TimeoutError:
+            petla = asyncio.get_running_loop()
+            czas_start = petla.time()
+            koniec = czas_start + 600
+            nastepny_ping = czas_start + 30
+
+            while (teraz := petla.time()) < koniec:
+                # get_message z timeoutem czeka na wiadomość po stronie klienta
+                # Redis — bez timeoutu wraca od razu z None i pętla kręci się
+                # bez przerwy (100% CPU na połączenie przy ciszy w kanale)
+                wiadomosc = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=min(1.0, koniec - teraz),
+                )
+
+                if wiadomosc is None:
                     # Ping co 30s
-                    czas_aktualny = asyncio.get_event_loop().time()
-                    if (czas_aktualny - czas_start) % 30 < 1:
+                    if petla.time() >= nastepny_ping:
+                        nastepny_ping += 30
                         try:
                             await websocket.send_text(json.dumps({"typ": "ping"}))
                         except Exception:
                             break
                     continue
 
-                if wiadomosc and wiadomosc.get("type") == "message":
+                if wiadomosc.get("type") == "message":
                     dane = wiadomosc.get("data", "")
                     await websocket.send_text(dane)
 
-                    # Zakończ po dotarciu do 100%
+                    # Zakończ po dotarciu do 100% (orjson — parsowanie każdej wiadomości postępu)
                     try:
-                        parsowane = json.loads(dane)
-                        if parsowane.get("procent", 0) >= 100 or parsowane.get("krok") in ["gotowe", "blad", "blad_krytyczny"]:
+                        parsowane = orjson.loads(dane)
+                        if parsowane.get("procent", 0) >= 100 or parsowane.get("krok") in KROKI_KONCOWE:
                             log.info("Pipeline zakończony — zamykam WebSocket")
                             await asyncio.sleep(0.5)
                             break
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         pass
 
         finally:
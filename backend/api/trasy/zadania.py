@@ -11,13 +11,13 @@ Endpointy:
 - GET  /api/v1/zadania             — Lista aktywnych zadań
 """
 
-import json
 import structlog
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 from celery.result import AsyncResult
 
-from konfiguracja import konf, pobierz_konfiguracje
+from konfiguracja import konf
 from celery_app import celery_app
 from rag.baza_wiedzy import pobierz_baze_wiedzy
 import uuid
@@ -110,12 +110,11 @@ Koszt: ~$0.14/wideo | Czas: ~90s
 )
 async def wyslij_zadanie(
     zadanie: ZadanieAsync,
-    konfiguracja: pobierz_konfiguracje = Depends(pobierz_konfiguracje),
 ) -> OdpowiedzAsync:
     """Asynchroniczny endpoint generacji — zwraca natychmiast."""
     log = logger.bind(endpoint="wyslij_zadanie")
 
-    if not konfiguracja.OPENAI_API_KEY:
+    if not konf.OPENAI_API_KEY:
         raise HTTPException(status_code=503, detail="Brak klucza OPENAI_API_KEY")
 
     sesja_id = str(uuid.uuid4())[:8]
@@ -167,17 +166,20 @@ async def wyslij_zadanie(
 async def pobierz_status_zadania(task_id: str) -> StatusZadania:
     """Sprawdza status zadania Celery (do pollingu)."""
     result = AsyncResult(task_id, app=celery_app)
+    # Każdy odczyt result.state (i .info) to zapytanie do backendu Celery
+    # dla niezakończonych zadań — stan czytamy raz, dalej tylko porównania
+    stan_celery = result.state
 
-    status_pl = STATUSY_PL.get(result.state, result.state.lower())
+    status_pl = STATUSY_PL.get(stan_celery, stan_celery.lower())
     sesja_id = task_id.replace("nexus-", "")
 
-    if result.state == "PENDING":
+    if stan_celery == "PENDING":
         return StatusZadania(
             task_id=task_id, sesja_id=sesja_id,
             status=status_pl, procent=0, wiadomosc="Oczekuję na wolnego workera...",
         )
 
-    elif result.state == "PROGRESS":
+    elif stan_celery == "PROGRESS":
         meta = result.info or {}
         return StatusZadania(
             task_id=task_id, sesja_id=sesja_id,
@@ -187,7 +189,7 @@ async def pobierz_status_zadania(task_id: str) -> StatusZadania:
             wiadomosc=meta.get("wiadomosc", ""),
         )
 
-    elif result.state == "SUCCESS":
+    elif stan_celery == "SUCCESS":
         return StatusZadania(
             task_id=task_id, sesja_id=sesja_id,
             status=status_pl, procent=100,
@@ -195,7 +197,7 @@ async def pobierz_status_zadania(task_id: str) -> StatusZadania:
             wynik=result.result,
         )
 
-    elif result.state == "FAILURE":
+    elif stan_celery == "FAILURE":
         return StatusZadania(
             task_id=task_id, sesja_id=sesja_id,
             status=status_pl, procent=0,
@@ -207,26 +209,32 @@ async def pobierz_status_zadania(task_id: str) -> StatusZadania:
         return StatusZadania(
             task_id=task_id, sesja_id=sesja_id,
             status=status_pl, procent=0,
-            wiadomosc=f"Status: {result.state}",
+            wiadomosc=f"Status: {stan_celery}",
         )
 
 
 @router.get(
     "/{task_id}/stan",
     summary="Stan z Redis (polling-friendly)",
+    response_model=None,
 )
-async def pobierz_stan_redis(task_id: str) -> dict:
-    """Pobiera ostatni znany stan z Redis pub/sub (szybszy niż polling Celery)."""
+async def pobierz_stan_redis(task_id: str) -> dict | Response:
+    """
+    Pobiera ostatni znany stan z Redis pub/sub (szybszy niż polling Celery).
+
+    Stan leży w Redis jako gotowy JSON — oddajemy bajty bez parsowania
+    i ponownego kodowania przez FastAPI.
+    """
     sesja_id = task_id.replace("nexus-", "")
 
     try:
         import redis.asyncio as aioredis
-        r = aioredis.from_url(konf.REDIS_URL, decode_responses=True)
+        r = aioredis.from_url(konf.REDIS_URL)
         stan_json = await r.get(f"nexus:stan:{sesja_id}")
         await r.aclose()
 
         if stan_json:
-            return json.loads(stan_json)
+            return Response(stan_json, media_type="application/json")
         else:
             return {"sesja_id": sesja_id, "krok": "oczekiwanie", "procent": 0, "wiadomosc": "Oczekuję..."}
     except Exception as e:
@@ -239,12 +247,12 @@ async def pobierz_stan_redis(task_id: str) -> dict:
 )
 async def anuluj_zadanie(task_id: str) -> dict:
     """Anuluje oczekujące lub aktywne zadanie Celery."""
-    result = AsyncResult(task_id, app=celery_app)
+    stan_celery = AsyncResult(task_id, app=celery_app).state
 
-    if result.state in ["SUCCESS", "FAILURE"]:
+    if stan_celery in ("SUCCESS", "FAILURE"):
         raise HTTPException(
             status_code=409,
-            detail=f"Nie można anulować zadania ze statusem: {result.state}"
+            detail=f"Nie można anulować zadania ze statusem: {stan_celery}"
         )
 
     celery_app.control.revoke(task_id, terminate=True)
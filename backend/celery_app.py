@@ -30,10 +30,19 @@ celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
     result_serializer="json",
+    # Wynik generuj_wideo_task (scenariusz, audio, wizualia, oceny) to
+    # dziesiątki KB — GET /zadania/{task_id} zwraca go z AsyncResult, więc
+    # nie ignore_result; zlib ze stdlib (zstd wymagałby pakietu zstandard)
+    result_compression="zlib",
+    result_extended=False,              # Bez args/kwargs zadania w backendzie
     timezone="Europe/Warsaw",
     enable_utc=True,
 
     # ─── Wydajność na laptopie ────────────────────────────────
+    # Pula prefork, nie eventlet/gevent: zadanie wideo prowadzi własną
+    # pętlę asyncio (uvloop) — monkey-patching eventlet/gevent jej nie
+    # obsługuje, a I/O (LLM, Redis, TTS) i tak jest już współbieżne
+    # wewnątrz pętli. Kompozycja FFmpeg potrzebuje prawdziwych procesów.
     worker_concurrency=2,               # 2 zadania równolegle
     worker_prefetch_multiplier=1,       # 1 zadanie na workera (bez przedwczesnego pobierania)
     task_acks_late=True,                # ACK po wykonaniu (nie po otrzymaniu)
@@ -9,7 +9,7 @@ Nowości v3.0:
   Poprzednie 0.78 = napisy na przyciskach TikToka na prawdziwym urządzeniu
 - [NAPRAWA BUG #3] Prawdziwa muzyka z progresją akordów (Am-F-C-G i inne)
   Zastępuje drone z sygnałami testowymi (55Hz, 110Hz...) prawdziwą harmonią
-  Używa wyłącznie stdlib Python (wave + math + struct) — zero zewnętrznych zależności
+  Synteza wektorowa NumPy (wave + numpy) — numpy już w wymaganiach backendu
   4-akordowe progresje per emocja + linia basowa + shimmer + ADSR envelope
 - [INNOWACJA 6] Synchronizacja cięć wizualnych do pauz mowy (silencedetect)
   FFmpeg silencedetect → naturalne granice zdań → cięcia w miejscach "oddechu"
@@ -28,11 +28,12 @@ Techniki produkcji:
 
 import os
 import math
-import struct
 import asyncio
 import structlog
 import random
 import wave as wave_mod
+import numpy as np
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -114,12 +115,51 @@ PROGRESJE_AKORDOW["zaskoczenie"] = PROGRESJE_AKORDOW["energia"]
 PROGRESJE_AKORDOW["profesjonalizm"] = PROGRESJE_AKORDOW["inspiracja"]
 
 
+@lru_cache(maxsize=1)
 def sprawdz_ffmpeg() -> bool:
+    # Przeszukanie PATH raz na proces — binarka nie znika w trakcie działania workera
     import shutil
     return shutil.which("ffmpeg") is not None
 
 
+@lru_cache(maxsize=1)
+def sprawdz_nvenc() -> bool:
+    """
+    Sprawdza czy h264_nvenc faktycznie enkoduje (raz na proces).
+
+    Samo `ffmpeg -encoders` nie wystarcza — build z NVENC bez GPU/sterownika
+    listuje enkoder, a pada przy pierwszej klatce. Próbny enkod 0.1s to rozstrzyga.
+    """
+    if not konf.UZYJ_NVENC or not sprawdz_ffmpeg():
+        return False
+    import subprocess
+    try:
+        wynik = subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1",
+                "-c:v", "h264_nvenc", "-f", "null", "-",
+            ],
+            capture_output=True,
+            timeout=15,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    dostepny = wynik.returncode == 0
+    logger.info("Enkoder wideo", nvenc=dostepny)
+    return dostepny
+
+
+def parametry_enkodera_wideo() -> list[str]:
+    """Zwraca parametry enkodera H.264: NVENC na GPU albo libx264 na CPU."""
+    if sprawdz_nvenc():
+        # p4 + VBR z docelową jakością ~ odpowiednik crf 20 libx264
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "23", "-b:v", "8M"]
+    return ["-c:v", "libx264", "-preset", "fast", "-crf", "20"]
+
+
 async def uruchom_ffmpeg(komenda: list[str], timeout: int = 300) -> tuple[bool, str]:
+    proc = None
     try:
         proc = await asyncio.create_subprocess_exec(
             *komenda,
@@ -130,15 +170,35 @@ async def uruchom_ffmpeg(komenda: list[str], timeout: int = 300) -> tuple[bool,
         sukces = proc.returncode == 0
         return sukces, stderr.decode("utf-8", errors="replace")
     except asyncio.TimeoutError:
+        _zabij_proces(proc)
         return False, "Timeout FFmpeg (>300s)"
+    except asyncio.CancelledError:
+        # Anulowane zadanie nie zostawia FFmpeg działającego w tle
+        _zabij_proces(proc)
+        raise
     except Exception as e:
         return False, str(e)
 
 
+def _zabij_proces(proc: asyncio.subprocess.Process | None) -> None:
+    if proc is not None and proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+# Znaki specjalne drawtext z gotowymi zamiennikami — kolejność zamian
+# ma znaczenie (backslash po apostrofie), więc krotka, nie słownik/translate
+ZAMIANY_DRAWTEXT = tuple(
+    (ch, f"\\{ch}") for ch in ("'", ":", "\\", "[", "]", "=", ";")
+)
+
+
 def escape_drawtext(tekst: str) -> str:
     """Escapuje znaki specjalne dla FFmpeg drawtext."""
-    for ch in ["'", ":", "\\", "[", "]", "=", ";"]:
-        tekst = tekst.replace(ch, f"\\{ch}")
+    for ch, zamiennik in ZAMIANY_DRAWTEXT:
+        tekst = tekst.replace(ch, zamiennik)
     return tekst
 
 
@@ -168,6 +228,20 @@ def zbuduj_filtr_napisow(
     # TikTok safe zone: y < 75% wysokości dla elementów treści
     y_pos = int(wysokosc * 0.68)
 
+    # Stała część filtra (czcionka, cień, pozycja, tło) składana raz, nie per segment
+    styl_napisu = (
+        f"fontsize=52:"
+        f"fontcolor=white:"
+        f"shadowcolor=black:"
+        f"shadowx=2:"
+        f"shadowy=2:"
+        f"x=(w-text_w)/2:"
+        f"y={y_pos}:"
+        f"box=1:"
+        f"boxcolor=black@0.55:"
+        f"boxborderw=12:"
+    )
+
     for seg in napisy:
         tekst = escape_drawtext(seg.get("tekst", ""))
         if not tekst:
@@ -179,16 +253,7 @@ def zbuduj_filtr_napisow(
         filtr = (
             f"drawtext="
             f"text='{tekst}':"
-            f"fontsize=52:"
-            f"fontcolor=white:"
-            f"shadowcolor=black:"
-            f"shadowx=2:"
-            f"shadowy=2:"
-            f"x=(w-text_w)/2:"
-            f"y={y_pos}:"
-            f"box=1:"
-            f"boxcolor=black@0.55:"
-            f"boxborderw=12:"
+            f"{styl_napisu}"
             f"enable='between(t,{t_start:.2f},{t_end:.2f})'"
         )
         filtry.append(filtr)
@@ -252,12 +317,17 @@ def zbuduj_cta_overlay(cta_tekst: str, czas_start: float, szerokosc: int = 1080,
 # [BUG #3 NAPRAWA] Prawdziwa muzyka z progresją akordów
 # ====================================================================
 
+_DWA_PI = 2 * math.pi
+# Pulsacja LFO modulacji AM (0.5 Hz)
+_OMEGA_LFO = _DWA_PI * 0.5
+
+
 def _generuj_probki_akordu(
     nuty: list[float],
     sr: int,
     czas_trwania: float,
     crossfade: float = 0.35,
-) -> list[float]:
+) -> np.ndarray:
     """
     Generuje próbki audio dla jednego akordu z ADSR envelope.
 
@@ -268,43 +338,84 @@ def _generuj_probki_akordu(
 
     ADSR: attack=crossfade, sustain=środek, release=crossfade
     Crossfade z sąsiednimi akordami = płynne przejście bez kliknięć.
+
+    Wektorowo (NumPy) — cały akord liczony operacjami na tablicy
+    zamiast pętli Pythona po ~88 tys. próbek. Fazy liczone w float64
+    (dokładność dla wysokich częstotliwości), próbki trzymane we float32 —
+    wyjście i tak jest 16-bitowe, a połowa pasma pamięci to szybszy sin/mnożenia.
     """
     n = int(sr * czas_trwania)
-    probki = []
+    t = np.arange(n) / sr
 
-    for i in range(n):
-        t = i / sr
+    # Składowe (amplituda, pulsacja 2πf) liczone raz per akord, nie per próbka
+    skladowe = (
+        # Pad — trzy nuty akordu (wyższe harmoniki cichsze: 0.12, 0.08, 0.05)
+        *((0.12 / (j + 1), _DWA_PI * freq) for j, freq in enumerate(nuty)),
+        # Bas — korzeń akordu oktawę niżej (mocna podstawa)
+        (0.20, _DWA_PI * nuty[0] / 2.0),
+        # Shimmer — 3. harmonik korzenia dla blasku i przestrzenności
+        (0.04, _DWA_PI * nuty[0] * 3),
+    )
 
-        # Envelope (ADSR uproszczone: fade in + sustain + fade out)
-        if t < crossfade:
-            env = t / crossfade
-        elif t > czas_trwania - crossfade:
-            env = (czas_trwania - t) / crossfade
-        else:
-            env = 1.0
+    probki = np.zeros(n, dtype=np.float32)
+    for amp, omega in skladowe:
+        probki += np.float32(amp) * np.sin((omega * t).astype(np.float32))
 
-        probka = 0.0
+    # Envelope (ADSR uproszczone: fade in + sustain + fade out)
+    env = np.minimum(1.0, np.minimum(t / crossfade, (czas_trwania - t) / crossfade))
 
-        # Pad — trzy nuty akordu (wyższe harmoniki cichsze: 0.12, 0.08, 0.05)
-        for j, freq in enumerate(nuty):
-            amp = 0.12 / (j + 1)
-            probka += amp * math.sin(2 * math.pi * freq * t)
+    # Lekka modulacja AM dla naturalności (zapobiega "plastyczności" syntezu)
+    lfo = 1.0 + 0.03 * np.sin(_OMEGA_LFO * t)
+    probki *= (env * lfo).astype(np.float32)
 
-        # Bas — korzeń akordu oktawę niżej (mocna podstawa)
-        bas_freq = nuty[0] / 2.0
-        probka += 0.20 * math.sin(2 * math.pi * bas_freq * t)
+    # Clipping protection
+    return np.clip(probki, -0.95, 0.95)
 
-        # Shimmer — 3. harmonik korzenia dla blasku i przestrzenności
-        probka += 0.04 * math.sin(2 * math.pi * nuty[0] * 3 * t)
 
-        # Lekka modulacja AM dla naturalności (zapobiega "plastyczności" syntezu)
-        lfo = 1.0 + 0.03 * math.sin(2 * math.pi * 0.5 * t)
-        probka *= env * lfo
+def _syntezuj_wav_muzyki(
+    sciezka_wav: str,
+    czas_trwania: float,
+    progresja: list[list[float]],
+) -> None:
+    """
+    Syntezuje próbki progresji akordów i zapisuje WAV stereo 16-bit.
 
-        # Clipping protection
-        probki.append(max(-0.95, min(0.95, probka)))
+    CPU-bound — wywoływana przez asyncio.to_thread, żeby nie blokować
+    pętli zdarzeń na czas syntezy.
+    """
+    sr = 44100
+    czas_na_akord = 2.0  # 2 sekundy per akord → 8-sekundowy cykl
+    czas_docelowy = czas_trwania + 2.0  # +2s bufor
 
-    return probki
+    # Każdy akord progresji syntezowany raz — kolejne cykle go tylko powtarzają
+    akordy = [
+        _generuj_probki_akordu(nuty, sr, czas_na_akord, crossfade=0.35)
+        for nuty in progresja
+    ]
+    liczba_akordow = math.ceil(czas_docelowy / czas_na_akord)
+    probki = np.concatenate([akordy[i % len(akordy)] for i in range(liczba_akordow)])
+
+    # Przytnij do dokładnego czasu
+    probki = probki[:int(czas_docelowy * sr)]
+
+    # Fade-in 2s i Fade-out 2s
+    fade_samples = int(2.0 * sr)
+    m = min(fade_samples, len(probki))
+    rampa = (np.arange(m) / fade_samples).astype(np.float32)
+    probki[:m] *= rampa
+    probki[len(probki) - m:] *= rampa[::-1]
+
+    # Stereo 16-bit z przeplotem kanałów — prawy -10% dla przestrzenności
+    ramki = np.empty((len(probki), 2), dtype="<i2")
+    ramki[:, 0] = np.clip(probki * np.float32(28000), -32768, 32767)
+    ramki[:, 1] = np.clip(probki * np.float32(0.90 * 28000), -32768, 32767)
+
+    # Zapisz jako WAV stereo 16-bit
+    with wave_mod.open(sciezka_wav, "w") as wf:
+        wf.setnchannels(2)   # Stereo
+        wf.setsampwidth(2)   # 16-bit
+        wf.setframerate(sr)
+        wf.writeframes(ramki.tobytes())
 
 
 async def generuj_muzyke_tla(
@@ -326,56 +437,17 @@ async def generuj_muzyke_tla(
     - Stereo: prawy kanał -10% amplitudy (naturalny efekt przestrzenny)
     - Fade-in 2s, Fade-out 2s
 
-    Zero zewnętrznych zależności — używa wyłącznie stdlib Python (wave + math + struct).
+    Synteza wektorowa NumPy + zapis przez stdlib wave.
     Konwersja WAV→AAC przez FFmpeg (już w systemie).
     """
     progresja = PROGRESJE_AKORDOW.get(emocja.lower(), PROGRESJE_AKORDOW["inspiracja"])
-
-    sr = 44100
-    czas_na_akord = 2.0  # 2 sekundy per akord → 8-sekundowy cykl
-
-    # Generuj ciągłą ścieżkę muzyczną przez cyklowanie progresji
-    wszystkie_probki: list[float] = []
-    idx_akordu = 0
-    czas_wygenerowany = 0.0
-    czas_docelowy = czas_trwania + 2.0  # +2s bufor
-
-    while czas_wygenerowany < czas_docelowy:
-        nuty = progresja[idx_akordu % len(progresja)]
-        probki = _generuj_probki_akordu(nuty, sr, czas_na_akord, crossfade=0.35)
-        wszystkie_probki.extend(probki)
-        czas_wygenerowany += czas_na_akord
-        idx_akordu += 1
-
-    # Przytnij do dokładnego czasu
-    n_docelowy = int(czas_docelowy * sr)
-    wszystkie_probki = wszystkie_probki[:n_docelowy]
-
-    # Fade-in 2s i Fade-out 2s
-    fade_samples = int(2.0 * sr)
-    for i in range(min(fade_samples, len(wszystkie_probki))):
-        wszystkie_probki[i] *= i / fade_samples
-    for i in range(min(fade_samples, len(wszystkie_probki))):
-        idx = len(wszystkie_probki) - 1 - i
-        wszystkie_probki[idx] *= i / fade_samples
-
-    # Zapisz jako WAV stereo 16-bit
     sciezka_wav = str(Path(sciezka_wyjsciowa).with_suffix(".wav"))
 
     try:
         Path(sciezka_wyjsciowa).parent.mkdir(parents=True, exist_ok=True)
 
-        with wave_mod.open(sciezka_wav, "w") as wf:
-            wf.setnchannels(2)   # Stereo
-            wf.setsampwidth(2)   # 16-bit
-            wf.setframerate(sr)
-
-            for p in wszystkie_probki:
-                l_samp = int(p * 28000)
-                r_samp = int(p * 0.90 * 28000)  # Prawy -10% dla przestrzenności
-                packed = struct.pack("<hh", max(-32768, min(32767, l_samp)),
-                                             max(-32768, min(32767, r_samp)))
-                wf.writeframes(packed)
+        # Synteza trwa sekundy czystego CPU — poza pętlą zdarzeń
+        await asyncio.to_thread(_syntezuj_wav_muzyki, sciezka_wav, czas_trwania, progresja)
 
         # Konwertuj WAV → AAC
         cmd = [
@@ -478,9 +550,9 @@ def wyrownaj_czas_do_pauzy(
     if not pauzy:
         return czas_sceny
 
-    najblizszа_pauza = min(pauzy, key=lambda p: abs(p - czas_sceny))
-    if abs(najblizszа_pauza - czas_sceny) <= tolerancja:
-        return najblizszа_pauza
+    najblizsza_pauza = min(pauzy, key=lambda p: abs(p - czas_sceny))
+    if abs(najblizsza_pauza - czas_sceny) <= tolerancja:
+        return najblizsza_pauza
 
     return czas_sceny
 
@@ -582,12 +654,12 @@ async def stworz_wideo_premium(
     czas_cta_start = max(0, calkowity_czas - 4.0)
     filtr_cta = zbuduj_cta_overlay(cta_tekst, czas_cta_start, 1080, 1920)
 
-    nakładki = [f for f in [filtr_napisow, filtr_hooka, filtr_cta] if f]
+    nakladki = [f for f in [filtr_napisow, filtr_hooka, filtr_cta] if f]
 
-    if nakładki:
+    if nakladki:
         tekst_filtry.append(
             f"{wyjscie_po_vignette}"
-            + ",".join(nakładki)
+            + ",".join(nakladki)
             + "[vfinal]"
         )
         wyjscie_finalne = "[vfinal]"
@@ -600,9 +672,10 @@ async def stworz_wideo_premium(
     # ── KOMENDA FFMPEG ────────────────────────────────────────────
     cmd = ["ffmpeg", "-y"]
 
+    # Dokładnie tyle, ile potrzebuje filtr — bez nadmiarowych klatek w kolejce demuxera
+    dur = czas_per_obraz + (czas_crossfade if n > 1 else 0)
     for img in obrazy:
-        dur = czas_per_obraz + (czas_crossfade if len(obrazy) > 1 else 0)
-        cmd.extend(["-loop", "1", "-t", str(dur + 1), "-i", img])
+        cmd.extend(["-loop", "1", "-framerate", str(fps), "-t", str(dur), "-i", img])
 
     has_audio = os.path.exists(audio_narracja) if audio_narracja else False
     audio_idx = len(obrazy)
@@ -632,10 +705,9 @@ async def stworz_wideo_premium(
             "-af", "loudnorm=I=-16:LRA=11:TP=-1.5",
         ])
 
+    # Pierwsze wywołanie sonduje GPU próbnym enkodem — poza pętlą zdarzeń
+    cmd.extend(await asyncio.to_thread(parametry_enkodera_wideo))
     cmd.extend([
-        "-c:v", "libx264",
-        "-preset", "fast",
-        "-crf", "20",
         "-pix_fmt", "yuv420p",
         "-r", "30",
         "-movflags", "+faststart",
@@ -745,12 +817,33 @@ async def kompozytor(stan: StanNEXUS) -> dict:
 
     calkowity_czas = scenariusz["calkowity_czas"] if scenariusz else 60.0
 
+    # ── [BUG #3 NAPRAWA] Muzyka tła z progresją akordów ─────────
+    # Wybierz emocję z pierwszej sceny scenariusza
+    emocja_muzyki = "inspiracja"
+    if scenariusz and scenariusz.get("sceny"):
+        emocja_muzyki = scenariusz["sceny"][0].get("emocja", "inspiracja")
+
+    # Synteza muzyki nie zależy od niczego poniżej — rusza w tle i biegnie
+    # równolegle z detekcją pauz mowy (dwa niezależne procesy FFmpeg)
+    sciezka_muzyki = str(katalog_wyjscia / "muzyka_tla.aac")
+    zadanie_muzyki = asyncio.create_task(
+        generuj_muzyke_tla(sciezka_muzyki, calkowity_czas, emocja_muzyki)
+    )
+
     # ── [INNOWACJA 6] Znajdź pauzy mowy dla synchronizacji cięć ─────
     pauzy_mowy: list[float] = []
-    if audio_sciezka:
-        pauzy_mowy = await znajdz_pauzy_mowy(audio_sciezka)
-        if pauzy_mowy:
-            log.info("Znaleziono pauzy mowy do synchronizacji", pauzy=len(pauzy_mowy))
+    try:
+        if audio_sciezka:
+            pauzy_mowy = await znajdz_pauzy_mowy(audio_sciezka)
+        muzyka_ok = await zadanie_muzyki
+    except BaseException:
+        # Błąd detekcji pauz (lub anulowanie) nie zostawia osieroconej
+        # syntezy muzyki z działającym FFmpeg
+        zadanie_muzyki.cancel()
+        await asyncio.gather(zadanie_muzyki, return_exceptions=True)
+        raise
+    if pauzy_mowy:
+        log.info("Znaleziono pauzy mowy do synchronizacji", pauzy=len(pauzy_mowy))
 
     # Oblicz czas per obraz z wyrównaniem do pauz mowy
     bazowy_czas_per_obraz = max(2.5, calkowity_czas / len(obrazy_sciezki))
@@ -793,14 +886,6 @@ async def kompozytor(stan: StanNEXUS) -> dict:
 
     cta_tekst = scenariusz.get("cta", "") if scenariusz else "Obserwuj po więcej!"
 
-    # ── [BUG #3 NAPRAWA] Muzyka tła z progresją akordów ─────────
-    # Wybierz emocję z pierwszej sceny scenariusza
-    emocja_muzyki = "inspiracja"
-    if scenariusz and scenariusz.get("sceny"):
-        emocja_muzyki = scenariusz["sceny"][0].get("emocja", "inspiracja")
-
-    sciezka_muzyki = str(katalog_wyjscia / "muzyka_tla.aac")
-    muzyka_ok = await generuj_muzyke_tla(sciezka_muzyki, calkowity_czas, emocja_muzyki)
     audio_muzyka: Optional[str] = sciezka_muzyki if muzyka_ok else None
 
     # Platforma docelowa
@@ -820,20 +905,35 @@ async def kompozytor(stan: StanNEXUS) -> dict:
         platforma=platforma,
     )
 
+    # ── MINIATURKA ────────────────────────────────────────────────
+    sciezka_miniaturki = str(katalog_wyjscia / "miniaturka.jpg")
+    miniaturka_src = obrazy_sciezki[0]
+
+    sciezka_mini_specjalna = Path(konf.SCIEZKA_TYMCZASOWA) / sesja_id / "obrazy" / "miniaturka.png"
+    if sciezka_mini_specjalna.exists():
+        miniaturka_src = str(sciezka_mini_specjalna)
+
+    tytul_mini = scenariusz["tytul"] if scenariusz else ""
+
     # ── GENERUJ WIDEO ─────────────────────────────────────────────
+    # Miniaturka potrzebuje tylko obrazu źródłowego — renderuje się
+    # równolegle z głównym enkodowaniem zamiast czekać na jego koniec
     sciezka_wideo = str(katalog_wyjscia / "wideo_glowne.mp4")
 
-    sukces = await stworz_wideo_premium(
-        obrazy=obrazy_sciezki,
-        audio_narracja=audio_sciezka,
-        wyjscie=sciezka_wideo,
-        czas_per_obraz=czas_per_obraz,
-        napisy=napisy,
-        hook_tekst=hook_tekst,
-        cta_tekst=cta_tekst,
-        calkowity_czas=calkowity_czas,
-        audio_muzyka=audio_muzyka,
-        platforma=platforma,
+    sukces, _ = await asyncio.gather(
+        stworz_wideo_premium(
+            obrazy=obrazy_sciezki,
+            audio_narracja=audio_sciezka,
+            wyjscie=sciezka_wideo,
+            czas_per_obraz=czas_per_obraz,
+            napisy=napisy,
+            hook_tekst=hook_tekst,
+            cta_tekst=cta_tekst,
+            calkowity_czas=calkowity_czas,
+            audio_muzyka=audio_muzyka,
+            platforma=platforma,
+        ),
+        generuj_miniaturke(miniaturka_src, sciezka_miniaturki, tytul_mini),
     )
 
     if not sukces:
@@ -857,17 +957,6 @@ async def kompozytor(stan: StanNEXUS) -> dict:
             "krok_aktualny": "blad_compositora",
         }
 
-    # ── MINIATURKA ────────────────────────────────────────────────
-    sciezka_miniaturki = str(katalog_wyjscia / "miniaturka.jpg")
-    miniaturka_src = obrazy_sciezki[0]
-
-    sciezka_mini_specjalna = Path(konf.SCIEZKA_TYMCZASOWA) / sesja_id / "obrazy" / "miniaturka.png"
-    if sciezka_mini_specjalna.exists():
-        miniaturka_src = str(sciezka_mini_specjalna)
-
-    tytul_mini = scenariusz["tytul"] if scenariusz else ""
-    await generuj_miniaturke(miniaturka_src, sciezka_miniaturki, tytul_mini)
-
     rozmiar_mb = 0.0
     try:
         rozmiar_mb = round(os.path.getsize(sciezka_wideo) / (1024 * 1024), 2)
@@ -12,8 +12,8 @@ Koszt szacunkowy na wideo: ~$0.14
 """
 
 import os
-from functools import lru_cache
-from pydantic_settings import BaseSettings
+from typing import Final
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
 
@@ -74,6 +74,7 @@ class Konfiguracja(BaseSettings):
     # ----------------------------------------------------------------
     SCIEZKA_TYMCZASOWA: str = Field(default="/tmp/nexus", description="Pliki tymczasowe")
     SCIEZKA_WYJSCIOWA: str = Field(default="./dane/wideo", description="Gotowe wideo")
+    UZYJ_NVENC: bool = Field(default=False, description="Enkodowanie H.264 na GPU NVIDIA (h264_nvenc), fallback libx264")
 
     # ----------------------------------------------------------------
     # Limity i parametry
@@ -81,6 +82,8 @@ class Konfiguracja(BaseSettings):
     MAKS_DLUGOSC_WIDEO: int = Field(default=180, description="Maks. długość wideo w sekundach")
     MAKS_OBRAZOW_NA_SCENA: int = Field(default=5, description="Maks. liczba obrazów DALL-E na wideo")
     MAKS_PONOWNYCH_PROB: int = Field(default=3, description="Maks. liczba ponowień przy błędzie")
+    MAKS_ROWNOLEGLYCH_TTS: int = Field(default=8, description="Maks. równoległych syntez TTS per proces")
+    LIMIT_OBRAZOW_NA_MINUTE: int = Field(default=15, description="Limit wywołań DALL-E/min per proces (tier konta OpenAI)")
     PROG_JAKOSCI: int = Field(default=60, description="Minimalny wynik jakości (0-100)")
     PROG_WIRALNOSCI: int = Field(default=75, description="Wynik wiralności → odznaka 🔥")
 
@@ -99,17 +102,16 @@ class Konfiguracja(BaseSettings):
     TIKTOK_CLIENT_KEY: str = Field(default="", description="TikTok Research API")
     INSTAGRAM_ACCESS_TOKEN: str = Field(default="", description="Instagram Graph API")
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = True
-
-
-@lru_cache()
-def pobierz_konfiguracje() -> Konfiguracja:
-    """Zwraca singleton konfiguracji (cache LRU)."""
-    return Konfiguracja()
+    # frozen: konfiguracja niezmienna po starcie — moduły mogą bezpiecznie
+    # przepisywać wartości do stałych (i używać jej jako klucza cache)
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=True,
+        frozen=True,
+        extra="ignore",
+    )
 
 
-# Alias globalny
-konf = pobierz_konfiguracje()
+# Singleton konfiguracji — ustalony przy imporcie modułu (frozen, env czytany raz)
+konf: Final[Konfiguracja] = Konfiguracja()
@@ -20,14 +20,19 @@ Nowości v2.0:
 
 Używa:
 - OpenAI text-embedding-3-small ($0.020/1M tokenów — najtańszy, świetny)
-- Cosine similarity (zoptymalizowane — suma kwadratów zamiast zip pętli)
+- FAISS HNSW (iloczyn skalarny na znormalizowanych wektorach fp16) — ANN zamiast skanu liniowego
 - JSON persistence dla pamięci wiralności
 """
 
-import json
+import os
+import time
+import orjson
 import hashlib
 import asyncio
+import httpx
 import structlog
+import faiss
+import numpy as np
 from pathlib import Path
 from datetime import datetime, timezone
 from uuid import uuid4
@@ -71,6 +76,24 @@ Najskuteczniejsze CTA po polsku:
 # Plik persistencji pamięci wiralności
 PLIK_PAMIECI = Path("./dane/pamiec_wiralnosci.json")
 
+# Embeddingi dokumentów przeżywają restart procesu — zimny start workera
+# nie wysyła N zapytań do OpenAI o te same teksty marki
+KATALOG_CACHE_EMBEDDINGOW = Path(konf.SCIEZKA_TYMCZASOWA) / "cache" / "embeddingi"
+
+# float16: połowa pamięci i miejsca na dysku względem float32 (3 KB zamiast
+# 6 KB na wektor 1536-wym.) przy pomijalnej stracie precyzji cosinusa
+TYP_EMBEDDINGU = np.float16
+
+# Indeks HNSW: M sąsiadów na węzeł grafu, efSearch = szerokość przeszukiwania
+# (kompromis trafność/czas). Wektory w indeksie jako fp16 (ScalarQuantizer).
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+# Cache wyników wyszukiwania w pobierz_kontekst — ten sam brief (retry,
+# iteracje nad briefem) nie powtarza embeddingu zapytania i przeszukania
+TTL_CACHE_KONTEKSTU_S = 3600.0
+MAKS_WPISOW_CACHE_KONTEKSTU = 1024
+
 
 # ====================================================================
 # [INNOWACJA 9] Viral Pattern RAG — YouTube Trending
@@ -153,6 +176,48 @@ def _tydzien_temu_iso() -> str:
     return tydzien_temu.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+# ====================================================================
+# WSPÓŁDZIELONY KLIENT OPENAI (embeddingi)
+# ====================================================================
+
+LIMITY_POLACZEN_EMBEDDINGOW = httpx.Limits(
+    max_connections=50,
+    max_keepalive_connections=50,
+    keepalive_expiry=75.0,
+)
+
+_klient_embeddingow: AsyncOpenAI | None = None
+_petla_klienta_embeddingow: asyncio.AbstractEventLoop | None = None
+
+
+def pobierz_klienta_embeddingow() -> AsyncOpenAI:
+    """
+    Zwraca klienta OpenAI współdzielonego przez bazy wiedzy wszystkich marek.
+
+    Jedna pula keep-alive zamiast klienta per marka — zimne zapytanie kolejnej
+    marki nie płaci za handshake TCP+TLS. Przypięty do pętli zdarzeń
+    (worker Celery tworzy nową pętlę per zadanie).
+    """
+    global _klient_embeddingow, _petla_klienta_embeddingow
+    petla = asyncio.get_running_loop()
+    if _klient_embeddingow is None or _petla_klienta_embeddingow is not petla:
+        _klient_embeddingow = AsyncOpenAI(
+            api_key=konf.OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(limits=LIMITY_POLACZEN_EMBEDDINGOW),
+        )
+        _petla_klienta_embeddingow = petla
+    return _klient_embeddingow
+
+
+async def zamknij_klienta_embeddingow() -> None:
+    """Zamyka współdzielonego klienta embeddingów (shutdown aplikacji)."""
+    global _klient_embeddingow, _petla_klienta_embeddingow
+    if _klient_embeddingow is not None:
+        await _klient_embeddingow.close()
+    _klient_embeddingow = None
+    _petla_klienta_embeddingow = None
+
+
 # ====================================================================
 # [INNOWACJA 10] Asymetryczna Pamięć Wiralności
 # ====================================================================
@@ -176,8 +241,7 @@ class PamiecWiralnosci:
     Persistencja: JSON → prosta, zero zależności, przenośna.
     """
 
-    def __init__(self, klient_openai: AsyncOpenAI, sciezka_pliku: Path = PLIK_PAMIECI):
-        self._klient = klient_openai
+    def __init__(self, sciezka_pliku: Path = PLIK_PAMIECI):
         self._sciezka = sciezka_pliku
         self._pamiec: list[dict] = self._wczytaj()
         self._log = logger.bind(komponent="PamiecWiralnosci")
@@ -186,7 +250,7 @@ class PamiecWiralnosci:
         """Wczytuje pamięć z pliku JSON."""
         if self._sciezka.exists():
             try:
-                return json.loads(self._sciezka.read_text(encoding="utf-8"))
+                return orjson.loads(self._sciezka.read_bytes())
             except Exception:
                 pass
         return []
@@ -195,10 +259,8 @@ class PamiecWiralnosci:
         """Zapisuje pamięć do pliku JSON."""
         try:
             self._sciezka.parent.mkdir(parents=True, exist_ok=True)
-            self._sciezka.write_text(
-                json.dumps(self._pamiec, ensure_ascii=False, indent=2),
-                encoding="utf-8",
-            )
+            # Bez wcięć — do 500 wpisów × 1536 floatów embeddingu na każdy zapis
+            self._sciezka.write_bytes(orjson.dumps(self._pamiec))
         except Exception as e:
             self._log.warning("Błąd zapisu pamięci", blad=str(e))
 
@@ -214,7 +276,7 @@ class PamiecWiralnosci:
 
     async def _embed(self, tekst: str) -> list[float]:
         """Pobiera embedding tekstu."""
-        resp = await self._klient.embeddings.create(
+        resp = await pobierz_klienta_embeddingow().embeddings.create(
             model=konf.MODEL_EMBEDDINGI,
             input=tekst[:8000],
         )
@@ -312,6 +374,71 @@ class PamiecWiralnosci:
         return [w["hook"] for w in sukcesy[-n:] if w.get("hook")]
 
 
+# ====================================================================
+# CACHE EMBEDDINGÓW (dysk)
+# ====================================================================
+
+def _sciezka_cache_embeddingu(klucz: str) -> Path:
+    # Model w ścieżce — zmiana MODEL_EMBEDDINGI nie miesza wymiarów wektorów
+    return KATALOG_CACHE_EMBEDDINGOW / konf.MODEL_EMBEDDINGI / klucz[:2] / f"{klucz}.npy"
+
+
+def _wczytaj_z_cache_embeddingow(klucz: str) -> np.ndarray | None:
+    """Wczytuje embedding z dysku (None gdy brak lub plik uszkodzony)."""
+    sciezka = _sciezka_cache_embeddingu(klucz)
+    if not sciezka.exists():
+        return None
+    try:
+        return np.load(sciezka).astype(TYP_EMBEDDINGU, copy=False)
+    except (OSError, ValueError):
+        return None
+
+
+def _zapisz_w_cache_embeddingow(klucz: str, wektor: np.ndarray) -> None:
+    """Zapisuje embedding na dysk (atomowo: plik tymczasowy + os.replace)."""
+    cel = _sciezka_cache_embeddingu(klucz)
+    # Unikalny per zapis — API i workery Celery embedujące ten sam tekst
+    # nie piszą do wspólnego pliku tymczasowego
+    tymczasowy = cel.with_suffix(f".{uuid4().hex}.part")
+    try:
+        cel.parent.mkdir(parents=True, exist_ok=True)
+        with open(tymczasowy, "wb") as f:
+            np.save(f, wektor)
+        os.replace(tymczasowy, cel)
+    except OSError as e:
+        tymczasowy.unlink(missing_ok=True)
+        logger.debug("Nie udało się zapisać embeddingu w cache", blad=str(e))
+
+
+def _normalizuj(wektory: np.ndarray) -> np.ndarray:
+    """Normalizuje wektory (ostatnia oś) do długości 1 w float32 — cosinus staje się iloczynem skalarnym."""
+    wektory = np.asarray(wektory, dtype=np.float32)
+    return wektory / (np.linalg.norm(wektory, axis=-1, keepdims=True) + 1e-12)
+
+
+# ====================================================================
+# FRAGMENTACJA DOKUMENTÓW
+# ====================================================================
+
+# ~750 tokenów na fragment, 10% zakładki — zdanie przecięte granicą
+# okna trafia w całości do co najmniej jednego fragmentu
+ROZMIAR_FRAGMENTU = 3000
+NAKLADKA_FRAGMENTU = 300
+ROZMIAR_PACZKI_EMBEDDINGOW = 256
+
+
+def _chunkuj(
+    tekst: str,
+    rozmiar: int = ROZMIAR_FRAGMENTU,
+    nakladka: int = NAKLADKA_FRAGMENTU,
+) -> list[str]:
+    """Dzieli tekst na okna znakowe z zakładką (krótkie teksty bez zmian)."""
+    if len(tekst) <= rozmiar:
+        return [tekst]
+    krok = rozmiar - nakladka
+    return [tekst[i:i + rozmiar] for i in range(0, len(tekst) - nakladka, krok)]
+
+
 # ====================================================================
 # GŁÓWNA KLASA RAG
 # ====================================================================
@@ -323,18 +450,29 @@ class BazaWiedzyMarki:
     Nowości v2.0:
     - [INNOWACJA 9] Automatyczne zasilanie trendami YouTube
     - [INNOWACJA 10] Integracja z PamiecWiralnosci
-    - Zoptymalizowane cosine similarity (operacje wektorowe)
+    - Wyszukiwanie ANN: fragmenty dokumentów w indeksie FAISS HNSW (fp16),
+      wektory znormalizowane L2 → cosinus = iloczyn skalarny, zapytanie O(log N)
     """
 
     def __init__(self, nazwa_marki: str = "nexus"):
-        self._klient_openai = AsyncOpenAI(api_key=konf.OPENAI_API_KEY)
         self._nazwa_marki = nazwa_marki
         self._dokumenty: dict[str, str] = {}
-        self._embeddingi: dict[str, list[float]] = {}
+        self._embeddingi: dict[str, np.ndarray] = {}
+        # Indeks ANN fragmentów — budowany leniwie,
+        # unieważniany przy każdej zmianie _dokumenty
+        self._klucze: list[str] = []
+        self._indeks: faiss.Index | None = None
+        # Id wektora w indeksie = fragment dokumentu; indeks dokumentu per fragment
+        self._wlasciciele: np.ndarray | None = None
+        # Licznik zmian _dokumenty — przebudowa indeksu, w trakcie której
+        # dokumenty się zmieniły, nie podmienia nowszego stanu
+        self._wersja_dokumentow = 0
+        # hash briefu → (czas, sekcje kontekstu z bazy)
+        self._cache_kontekstu: dict[str, tuple[float, list[str]]] = {}
         self._log = logger.bind(komponent="BazaWiedzyMarki", marka=nazwa_marki)
 
         # Pamięć wiralności
-        self.pamiec_wiralnosci = PamiecWiralnosci(self._klient_openai)
+        self.pamiec_wiralnosci = PamiecWiralnosci()
 
         # Załaduj domyślną wiedzę
         for klucz, tekst in DOMYSLNA_BAZA_WIEDZY.items():
@@ -343,38 +481,93 @@ class BazaWiedzyMarki:
         self._log.info("Baza wiedzy marki v2.0 zainicjalizowana")
 
     def _hash_tekstu(self, tekst: str) -> str:
-        """Generuje hash tekstu (do cache'owania embedingów)."""
-        return hashlib.md5(tekst.encode()).hexdigest()[:8]
+        """Generuje hash BLAKE2b tekstu (klucz cache embeddingów w pamięci i na dysku)."""
+        return hashlib.blake2b(tekst.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _uniewaznij_indeks(self) -> None:
+        """Zmiana dokumentów: indeks do przebudowy, zapamiętane konteksty nieaktualne."""
+        self._indeks = None
+        self._wersja_dokumentow += 1
+        self._cache_kontekstu.clear()
 
     async def dodaj_dokument(self, klucz: str, tekst: str) -> None:
-        """Dodaje dokument do bazy wiedzy."""
-        self._dokumenty[klucz] = tekst
-        self._embeddingi.pop(klucz, None)
+        """
+        Dodaje dokument do bazy wiedzy.
+
+        Embeddingi fragmentów liczone od razu — wyszukaj() embeduje już tylko
+        zapytanie. Nowy klucz trafia wprost do istniejącego indeksu HNSW;
+        podmiana treści pod starym kluczem wymaga przebudowy (HNSW nie usuwa).
+        """
+        if self._dokumenty.get(klucz) == tekst:
+            return  # np. te same trendy dnia — indeks i cache kontekstu zostają
+
+        wektory = await self._pobierz_embeddingi_batch(_chunkuj(tekst))
+        self._wstaw_dokument(klucz, tekst, wektory)
         self._log.info("Dokument dodany", klucz=klucz, dlugosc=len(tekst))
 
-    async def _pobierz_embedding(self, tekst: str) -> list[float]:
-        """Pobiera embedding z OpenAI (z cache)."""
-        hash_klucz = self._hash_tekstu(tekst)
+    def _wstaw_dokument(self, klucz: str, tekst: str, wektory: list[np.ndarray]) -> None:
+        """Zapisuje dokument z gotowymi embeddingami fragmentów (bez await — atomowo)."""
+        nowy_klucz = klucz not in self._dokumenty
+        self._dokumenty[klucz] = tekst
+        if nowy_klucz and self._indeks is not None:
+            self._indeks.add(_normalizuj(np.stack(wektory)))
+            self._wlasciciele = np.concatenate([
+                self._wlasciciele,
+                np.full(len(wektory), len(self._klucze), dtype=np.intp),
+            ])
+            self._klucze.append(klucz)
+            self._wersja_dokumentow += 1
+            self._cache_kontekstu.clear()
+        else:
+            self._uniewaznij_indeks()
+
+    async def _pobierz_embeddingi_batch(self, teksty: list[str]) -> list[np.ndarray]:
+        """
+        Pobiera embeddingi wielu tekstów (cache: pamięć → dysk → API).
 
-        if hash_klucz not in self._embeddingi:
-            tekst_skrocony = tekst[:30000]
-            odpowiedz = await self._klient_openai.embeddings.create(
-                model=konf.MODEL_EMBEDDINGI,
-                input=tekst_skrocony,
-            )
-            self._embeddingi[hash_klucz] = odpowiedz.data[0].embedding
+        Wszystkie brakujące teksty idą do OpenAI jednym żądaniem
+        (input=[t1, t2, ...]) — 1 round-trip zamiast N.
+        """
+        klucze = [self._hash_tekstu(t) for t in teksty]
 
-        return self._embeddingi[hash_klucz]
+        # Odczyty z dysku równolegle w puli wątków zamiast po kolei
+        do_sprawdzenia = {
+            k: t for k, t in zip(klucze, teksty) if k not in self._embeddingi
+        }
+        z_dysku = await asyncio.gather(*[
+            asyncio.to_thread(_wczytaj_z_cache_embeddingow, k) for k in do_sprawdzenia
+        ])
+
+        brakujace: dict[str, str] = {}
+        for (klucz, tekst), wektor in zip(do_sprawdzenia.items(), z_dysku):
+            if wektor is None:
+                brakujace[klucz] = tekst[:30000]
+            else:
+                self._embeddingi[klucz] = wektor
+
+        if brakujace:
+            klucze_brakujace = list(brakujace)
+            teksty_brakujace = list(brakujace.values())
+            # Paczki mieszczą się w limicie tokenów jednego żądania (fragmenty ~750 tok.)
+            for start in range(0, len(klucze_brakujace), ROZMIAR_PACZKI_EMBEDDINGOW):
+                odpowiedz = await pobierz_klienta_embeddingow().embeddings.create(
+                    model=konf.MODEL_EMBEDDINGI,
+                    input=teksty_brakujace[start:start + ROZMIAR_PACZKI_EMBEDDINGOW],
+                )
+                # Odpowiedź niesie indeks wejścia — nie polegamy na kolejności
+                for element in odpowiedz.data:
+                    klucz = klucze_brakujace[start + element.index]
+                    self._embeddingi[klucz] = np.asarray(element.embedding, dtype=TYP_EMBEDDINGU)
+            await asyncio.gather(*[
+                asyncio.to_thread(_zapisz_w_cache_embeddingow, k, self._embeddingi[k])
+                for k in klucze_brakujace
+            ])
 
-    @staticmethod
-    def _podobienstwo_cosinusowe(vec1: list[float], vec2: list[float]) -> float:
-        """Zoptymalizowane cosine similarity."""
-        dot = sum(a * b for a, b in zip(vec1, vec2))
-        m1 = sum(a * a for a in vec1) ** 0.5
-        m2 = sum(b * b for b in vec2) ** 0.5
-        if m1 == 0 or m2 == 0:
-            return 0.0
-        return dot / (m1 * m2)
+        return [self._embeddingi[k] for k in klucze]
+
+    async def _pobierz_embedding(self, tekst: str) -> np.ndarray:
+        """Pobiera embedding pojedynczego tekstu."""
+        return (await self._pobierz_embeddingi_batch([tekst]))[0]
 
     async def wyszukaj(
         self, zapytanie: str, top_k: int = 3
@@ -388,16 +581,56 @@ class BazaWiedzyMarki:
         if not self._dokumenty:
             return []
 
-        embedding_zapytania = await self._pobierz_embedding(zapytanie)
-
-        wyniki = []
-        for klucz, tekst in self._dokumenty.items():
-            embedding_dok = await self._pobierz_embedding(tekst)
-            podobienstwo = self._podobienstwo_cosinusowe(embedding_zapytania, embedding_dok)
-            wyniki.append((klucz, tekst, podobienstwo))
-
-        wyniki.sort(key=lambda x: x[2], reverse=True)
-        return wyniki[:top_k]
+        indeks = None
+        if self._indeks is not None:
+            embedding_zapytania = await self._pobierz_embedding(zapytanie)
+            # Migawka dopiero po await — dodaj_dokument mógł w międzyczasie
+            # dopisać fragmenty albo unieważnić indeks
+            indeks, klucze, wlasciciele_fragmentow = self._indeks, self._klucze, self._wlasciciele
+
+        if indeks is None:
+            # Zapytanie + fragmenty wszystkich dokumentów w jednym żądaniu embeddingów
+            # (fragmenty zwykle już w cache — dodaj_dokument liczy je przy wstawieniu)
+            wersja = self._wersja_dokumentow
+            klucze = list(self._dokumenty)
+            fragmenty: list[str] = []
+            wlasciciele: list[int] = []
+            for i, klucz in enumerate(klucze):
+                for fragment in _chunkuj(self._dokumenty[klucz]):
+                    fragmenty.append(fragment)
+                    wlasciciele.append(i)
+            wektory = await self._pobierz_embeddingi_batch([zapytanie] + fragmenty)
+            embedding_zapytania = wektory[0]
+
+            macierz = _normalizuj(np.stack(wektory[1:]))
+            indeks = faiss.IndexHNSWSQ(
+                macierz.shape[1], faiss.ScalarQuantizer.QT_fp16, HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+            indeks.train(macierz)
+            indeks.add(macierz)
+            indeks.hnsw.efSearch = HNSW_EF_SEARCH
+            wlasciciele_fragmentow = np.asarray(wlasciciele, dtype=np.intp)
+
+            if wersja == self._wersja_dokumentow:
+                self._klucze = klucze
+                self._wlasciciele = wlasciciele_fragmentow
+                self._indeks = indeks
+
+        # Nadmiarowe k — kilka najlepszych fragmentów może należeć do jednego dokumentu
+        k = min(indeks.ntotal, max(top_k * 4, 16))
+        podobienstwa, id_fragmentow = indeks.search(_normalizuj(embedding_zapytania)[None, :], k)
+
+        # Wynik dokumentu = najlepszy z jego fragmentów (FAISS zwraca malejąco)
+        wyniki_dok: dict[int, float] = {}
+        for sim, id_fragmentu in zip(podobienstwa[0], id_fragmentow[0]):
+            if id_fragmentu < 0:
+                continue
+            wyniki_dok.setdefault(int(wlasciciele_fragmentow[id_fragmentu]), float(sim))
+
+        return [
+            (klucze[i], self._dokumenty[klucze[i]], sim)
+            for i, sim in list(wyniki_dok.items())[:top_k]
+        ]
 
     async def pobierz_kontekst(self, brief: str) -> str:
         """
@@ -405,15 +638,25 @@ class BazaWiedzyMarki:
         Wzbogacony o trendy YouTube (jeśli dostępne) i wzorce sukcesów.
         """
         try:
-            # Wyszukaj z bazy wiedzy
-            wyniki = await self.wyszukaj(brief, top_k=3)
-
-            kontekst_czesci = []
-            for klucz, tekst, podobienstwo in wyniki:
-                if podobienstwo > 0.3:
-                    kontekst_czesci.append(f"### {klucz.upper()}:\n{tekst}")
-
-            # Dołącz wzorce sukcesów z pamięci wiralności
+            klucz_cache = self._hash_tekstu(brief)
+            wpis = self._cache_kontekstu.get(klucz_cache)
+            if wpis is not None and time.monotonic() - wpis[0] < TTL_CACHE_KONTEKSTU_S:
+                sekcje_bazy = wpis[1]
+            else:
+                # Wyszukaj z bazy wiedzy
+                wyniki = await self.wyszukaj(brief, top_k=3)
+                sekcje_bazy = [
+                    f"### {klucz.upper()}:\n{tekst}"
+                    for klucz, tekst, podobienstwo in wyniki
+                    if podobienstwo > 0.3
+                ]
+                if len(self._cache_kontekstu) >= MAKS_WPISOW_CACHE_KONTEKSTU:
+                    self._cache_kontekstu.pop(next(iter(self._cache_kontekstu)))
+                self._cache_kontekstu[klucz_cache] = (time.monotonic(), sekcje_bazy)
+
+            kontekst_czesci = list(sekcje_bazy)
+
+            # Dołącz wzorce sukcesów z pamięci wiralności (zawsze świeże — poza cache)
             wzorce_sukcesu = self.pamiec_wiralnosci.pobierz_wzorce_sukcesow(3)
             if wzorce_sukcesu:
                 kontekst_czesci.append(
@@ -422,7 +665,7 @@ class BazaWiedzyMarki:
                 )
 
             kontekst = "\n\n".join(kontekst_czesci)
-            self._log.info("Kontekst RAG v2.0 pobrany", dokumenty=len(wyniki), dlugosc=len(kontekst))
+            self._log.info("Kontekst RAG v2.0 pobrany", dokumenty=len(sekcje_bazy), dlugosc=len(kontekst))
             return kontekst
 
         except Exception as e:
@@ -442,11 +685,32 @@ class BazaWiedzyMarki:
             await self.dodaj_dokument(klucz, trendy)
             self._log.info("Baza zasilona trendami YouTube", nisza=nisza, znaki=len(trendy))
 
-    def zaladuj_profil_marki(self, profil: dict) -> None:
-        """Ładuje profil marki do bazy."""
-        for klucz, wartosc in profil.items():
-            if isinstance(wartosc, str) and wartosc.strip():
-                self._dokumenty[f"marka_{klucz}"] = wartosc
+    async def zaladuj_profil_marki(self, profil: dict) -> None:
+        """
+        Ładuje profil marki do bazy.
+
+        Jak dodaj_dokument: embeddingi liczone przy ładowaniu — fragmenty
+        wszystkich zmienionych pól profilu jednym wywołaniem batch.
+        """
+        nowe = {
+            f"marka_{klucz}": wartosc
+            for klucz, wartosc in profil.items()
+            if isinstance(wartosc, str) and wartosc.strip()
+            and self._dokumenty.get(f"marka_{klucz}") != wartosc
+        }
+        if not nowe:
+            return
+
+        fragmenty = [_chunkuj(tekst) for tekst in nowe.values()]
+        wektory = await self._pobierz_embeddingi_batch(
+            [fragment for fragmenty_dok in fragmenty for fragment in fragmenty_dok]
+        )
+
+        poczatek = 0
+        for (klucz, tekst), fragmenty_dok in zip(nowe.items(), fragmenty):
+            self._wstaw_dokument(klucz, tekst, wektory[poczatek:poczatek + len(fragmenty_dok)])
+            poczatek += len(fragmenty_dok)
+        self._log.info("Profil marki załadowany", pola=len(nowe))
 
 
 # ====================================================================
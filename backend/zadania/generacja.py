@@ -13,15 +13,75 @@ Kanał Redis dla postępu: nexus:progress:{sesja_id}
 """
 
 import asyncio
-import json
+import bisect
+import functools
 import time
+from types import MappingProxyType
+from typing import Final, Mapping
+import orjson
+import redis
+import redis.asyncio as aioredis
 import structlog
-from celery import Task
-
+from celery import Task, group
+from celery.result import GroupResult
+from celery.signals import worker_process_init
+
+from agenci.orkiestrator import (
+    pobierz_orkiestratora,
+    zaplanuj_zapis_stanu,
+    oproznij_zapisy_stanu,
+    wczytaj_checkpoint_sesji,
+    usun_checkpoint_sesji,
+    zastosuj_aktualizacje,
+    zamknij_redis_stanu,
+)
+from agenci.producent_wizualny import zamknij_klienta_pobierania
+from agenci.rezyser_glosu import zamknij_klienta_tts
+from analityka.silnik_wiralnosci import oblicz_nwv_heurystyczny
 from celery_app import celery_app
+from konfiguracja import konf
+from rag.baza_wiedzy import zamknij_klienta_embeddingow
+
+try:
+    import uvloop
+except ImportError:  # Windows — uvloop niedostępny, zostaje pętla asyncio
+    uvloop = None
 
 logger = structlog.get_logger(__name__)
 
+# Węzeł grafu → (procent, wiadomość) publikowane po jego ukończeniu
+ETAPY_PIPELINE: Final[Mapping[str, tuple[int, str]]] = MappingProxyType({
+    "strateg_tresci": (15, "Strateg Treści tworzy plan..."),
+    "pisarz_scenariuszy": (30, "Pisarz Scenariuszy pisze scenariusz..."),
+    "produkcja_rownolegla": (55, "Reżyser Głosu + Producent Wizualny pracują równolegle..."),
+    "recenzent_jakosci": (80, "Recenzent Jakości ocenia wideo..."),
+    "compositor": (92, "Compositor scala wideo MP4..."),
+})
+
+# Pola stanu przepisywane do wyniku zadania bez zmian
+_WYNIK_KLUCZE: Final = (
+    "wideo",
+    "scenariusz",
+    "audio",
+    "wizualia",
+    "ocena_jakosci",
+    "ocena_wiralnosci",
+    "plan_tresci",
+)
+
+# Powtórzenie tego samego (krok, procent) w tym oknie nie jest publikowane
+MIN_ODSTEP_POSTEPU_S = 0.2
+
+
+def _nowa_petla() -> asyncio.AbstractEventLoop:
+    """Pętla dla zadania — uvloop (libuv) gdy dostępny, inaczej asyncio."""
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    # Python 3.12+: korutyny kończące się bez zawieszenia (szybkie węzły,
+    # zapisy stanu) nie przechodzą przez kolejkę pętli
+    if hasattr(asyncio, "eager_task_factory"):
+        loop.set_task_factory(asyncio.eager_task_factory)
+    return loop
+
 
 class ZadanieZPostepem(Task):
     """Bazowa klasa zadania z obsługą postępu."""
@@ -38,19 +98,110 @@ class ZadanieZPostepem(Task):
         logger.warning("Ponawiam zadanie Celery", task_id=task_id, blad=str(exc))
 
 
+@functools.lru_cache(maxsize=4)
+def _klient_redis(redis_url: str) -> redis.Redis:
+    """Jeden klient (z własną pulą połączeń) na URL — na cały proces workera."""
+    return redis.Redis.from_url(redis_url, socket_keepalive=True, health_check_interval=30)
+
+
+@functools.lru_cache(maxsize=1024)
+def _klucze_postepu(sesja_id: str) -> tuple[bytes, bytes]:
+    """(kanał pub/sub, klucz stanu dla pollingu) sesji — zakodowane raz."""
+    return f"nexus:progress:{sesja_id}".encode(), f"nexus:stan:{sesja_id}".encode()
+
+
 def opublikuj_postep(redis_url: str, sesja_id: str, postep: dict) -> None:
     """Publikuje postęp do Redis pub/sub."""
     try:
-        import redis
-        r = redis.from_url(redis_url)
-        kanal = f"nexus:progress:{sesja_id}"
-        r.publish(kanal, json.dumps(postep, ensure_ascii=False))
-        # Zapisz stan dla pollingu
-        r.setex(f"nexus:stan:{sesja_id}", 86400, json.dumps(postep, ensure_ascii=False))
+        r = _klient_redis(redis_url)
+        payload = orjson.dumps(postep)
+        kanal, klucz_stanu = _klucze_postepu(sesja_id)
+        # PUBLISH + stan dla pollingu w jednym round-tripie
+        pipe = r.pipeline(transaction=False)
+        pipe.publish(kanal, payload)
+        pipe.setex(klucz_stanu, 86400, payload)
+        pipe.execute()
     except Exception as e:
         logger.warning("Błąd publikacji postępu", blad=str(e))
 
 
+# Postęp z wnętrza pipeline'u — klient asyncio, żeby PUBLISH nie blokował
+# pętli (i streamu LangGraph). Celery tworzy nową pętlę per zadanie.
+_redis_postepu: aioredis.Redis | None = None
+_petla_redis_postepu: asyncio.AbstractEventLoop | None = None
+
+
+def _pobierz_redis_postepu() -> aioredis.Redis:
+    """Zwraca klienta Redis postępu dla bieżącej pętli zdarzeń."""
+    global _redis_postepu, _petla_redis_postepu
+    petla = asyncio.get_running_loop()
+    if _redis_postepu is None or _petla_redis_postepu is not petla:
+        _redis_postepu = aioredis.from_url(konf.REDIS_URL, max_connections=16)
+        _petla_redis_postepu = petla
+    return _redis_postepu
+
+
+async def zamknij_redis_postepu() -> None:
+    """Zamyka klienta Redis postępu (przed zamknięciem pętli zadania)."""
+    global _redis_postepu, _petla_redis_postepu
+    if _redis_postepu is not None:
+        await _redis_postepu.aclose()
+    _redis_postepu = None
+    _petla_redis_postepu = None
+
+
+# Bufor postępu między streamem LangGraph a Redis — iteracja grafu nie
+# czeka na RTT; pełny bufor spowalnia producenta zamiast rosnąć bez końca
+ROZMIAR_BUFORA_POSTEPU = 64
+MAKS_PACZKA_POSTEPU = 32
+
+
+async def _zamknij_klientow_petli() -> None:
+    """
+    Zamyka wszystkich klientów przypiętych do pętli zadania — kolejne
+    zadanie dostaje nową pętlę, a fabryki tylko nadpisałyby globalne
+    referencje, zostawiając otwarte pule połączeń.
+    """
+    await asyncio.gather(
+        zamknij_redis_postepu(),
+        zamknij_redis_stanu(),
+        zamknij_klienta_tts(),
+        zamknij_klienta_pobierania(),
+        zamknij_klienta_embeddingow(),
+        return_exceptions=True,
+    )
+
+
+async def _wysylaj_postep(sesja_id: str, kolejka: asyncio.Queue) -> None:
+    """
+    Konsument bufora postępu: zbiera dostępne zdarzenia (do
+    MAKS_PACZKA_POSTEPU) i wysyła je jednym pipeline'em — PUBLISH
+    każdego, SETEX stanu tylko dla najnowszego.
+    """
+    kanal, klucz_stanu = _klucze_postepu(sesja_id)
+    while True:
+        paczka = [await kolejka.get()]
+        while not kolejka.empty() and len(paczka) < MAKS_PACZKA_POSTEPU:
+            paczka.append(kolejka.get_nowait())
+        try:
+            pipe = _pobierz_redis_postepu().pipeline(transaction=False)
+            for postep in paczka:
+                pipe.publish(kanal, orjson.dumps(postep))
+            pipe.setex(klucz_stanu, 86400, orjson.dumps(paczka[-1]))
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("Błąd publikacji postępu", blad=str(e))
+        finally:
+            for _ in paczka:
+                kolejka.task_done()
+
+
+@worker_process_init.connect
+def _rozgrzej_orkiestratora(**_) -> None:
+    """Kompiluje graf przy starcie procesu workera, nie przy pierwszym zadaniu."""
+    pobierz_orkiestratora()
+
+
 @celery_app.task(
     bind=True,
     base=ZadanieZPostepem,
@@ -79,13 +230,35 @@ def generuj_wideo_task(
     Returns:
         Słownik z wynikami generacji
     """
-    from konfiguracja import konf
-
     log = logger.bind(task_id=self.request.id, sesja_id=sesja_id)
     log.info("Celery: rozpoczynam generację wideo")
 
-    def postep(krok: str, procent: int, wiadomosc: str):
-        """Aktualizuje postęp i publikuje do Redis."""
+    ostatni = {"krok": None, "procent": -1, "t": 0.0}
+
+    def nowe_zdarzenie(krok: str, procent: int) -> bool:
+        """
+        False dla duplikatu — ten sam (krok, procent) w ciągu
+        MIN_ODSTEP_POSTEPU_S. 0% i 100% przechodzą zawsze.
+        """
+        teraz = time.monotonic()
+        if (
+            procent not in (0, 100)
+            and krok == ostatni["krok"]
+            and procent == ostatni["procent"]
+            and teraz - ostatni["t"] < MIN_ODSTEP_POSTEPU_S
+        ):
+            return False
+        ostatni.update(krok=krok, procent=procent, t=teraz)
+        return True
+
+    def stan_zadania(krok: str, procent: int, wiadomosc: str) -> bool:
+        """
+        Kamień milowy: aktualizuje stan zadania Celery (bez publikacji do
+        Redis pub/sub). Zwraca False dla duplikatu — wtedy zdarzenie nie
+        jest też publikowane.
+        """
+        if not nowe_zdarzenie(krok, procent):
+            return False
         self.update_state(
             state="PROGRESS",
             meta={
@@ -95,6 +268,10 @@ def generuj_wideo_task(
                 "wiadomosc": wiadomosc,
             }
         )
+        log.info(f"[{procent}%] {krok}: {wiadomosc}")
+        return True
+
+    def publikuj(krok: str, procent: int, wiadomosc: str):
         opublikuj_postep(konf.REDIS_URL, sesja_id, {
             "sesja_id": sesja_id,
             "krok": krok,
@@ -102,39 +279,50 @@ def generuj_wideo_task(
             "wiadomosc": wiadomosc,
             "timestamp": time.time(),
         })
-        log.info(f"[{procent}%] {krok}: {wiadomosc}")
-
-    try:
-        postep("start", 0, "Pipeline uruchomiony")
 
-        # Import tutaj aby uniknąć circular imports
-        from agenci.orkiestrator import OrkiestratorNEXUS
+    # Stan zadania Celery to kolejny zapis do backendu wyników — frontend
+    # czyta postęp z pub/sub i nexus:stan:*, więc AsyncResult dostaje
+    # tylko kamienie milowe (start, etapy z ETAPY_PIPELINE, gotowe)
+    def postep_etap(krok: str, procent: int, wiadomosc: str):
+        """Kamień milowy: stan zadania Celery + publikacja do Redis."""
+        if stan_zadania(krok, procent, wiadomosc):
+            publikuj(krok, procent, wiadomosc)
 
-        orkiestrator = OrkiestratorNEXUS()
+    def postep_tick(krok: str, procent: int, wiadomosc: str):
+        """Postęp pośredni: tylko publikacja do Redis."""
+        if nowe_zdarzenie(krok, procent):
+            log.info(f"[{procent}%] {krok}: {wiadomosc}")
+            publikuj(krok, procent, wiadomosc)
 
-        # Uruchom async pipeline w pętli eventów Celery
-        postep("strateg", 10, "Strateg Treści analizuje brief...")
+    try:
+        postep_etap("start", 0, "Pipeline uruchomiony")
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        orkiestrator = pobierz_orkiestratora()
 
-        try:
-            # Monkey-patch postęp do pipeline
-            wynik = loop.run_until_complete(
-                _uruchom_z_postepem(
-                    orkiestrator,
-                    sesja_id=sesja_id,
-                    brief=brief,
-                    platforma=platforma,
-                    marka=marka,
-                    kontekst_marki=kontekst_marki,
-                    callback_postepu=postep,
+        # Uruchom async pipeline w pętli eventów Celery
+        postep_tick("strateg", 10, "Strateg Treści analizuje brief...")
+
+        # Runner przy zamknięciu anuluje wiszące zadania, domyka async
+        # generatory (stream LangGraph) i domyślny executor
+        with asyncio.Runner(loop_factory=_nowa_petla) as runner:
+            try:
+                wynik = runner.run(
+                    _uruchom_z_postepem(
+                        orkiestrator,
+                        sesja_id=sesja_id,
+                        brief=brief,
+                        platforma=platforma,
+                        marka=marka,
+                        kontekst_marki=kontekst_marki,
+                        callback_postepu=stan_zadania,
+                    )
                 )
-            )
-        finally:
-            loop.close()
+            finally:
+                # Ponowienie zaczyna od checkpointu w Redis, nie od resztek w pamięci
+                orkiestrator.zwolnij_sesje(sesja_id)
+                runner.run(_zamknij_klientow_petli())
 
-        postep("gotowe", 100, "Wideo wygenerowane!")
+        postep_etap("gotowe", 100, "Wideo wygenerowane!")
 
         return wynik
 
@@ -161,21 +349,11 @@ async def _uruchom_z_postepem(
 ) -> dict:
     """
     Uruchamia pipeline orkiestratora z callbackami postępu.
-    """
-    # Uruchom pipeline (orkiestrator streamuje zdarzenia)
-    from konfiguracja import konf
-    import redis as redis_sync
-
-    r = redis_sync.from_url(konf.REDIS_URL)
-
-    ETAPY_PIPELINE = {
-        "strateg_tresci": (15, "Strateg Treści tworzy plan..."),
-        "pisarz_scenariuszy": (30, "Pisarz Scenariuszy pisze scenariusz..."),
-        "produkcja_rownolegla": (55, "Reżyser Głosu + Producent Wizualny pracują równolegle..."),
-        "recenzent_jakosci": (80, "Recenzent Jakości ocenia wideo..."),
-        "compositor": (92, "Compositor scala wideo MP4..."),
-    }
 
+    `callback_postepu` aktualizuje stan zadania Celery i zwraca False dla
+    zdublowanego zdarzenia; publikacja do Redis pub/sub idzie przez bufor
+    i zadanie w tle (_wysylaj_postep), bez blokowania streamu.
+    """
     # Stream zdarzeń LangGraph
     config = {"configurable": {"thread_id": sesja_id}}
     stan_poczatkowy = {
@@ -198,29 +376,69 @@ async def _uruchom_z_postepem(
         "czas_generacji_s": 0.0,
     }
 
-    wynik_koncowy = None
-    async for zdarzenie in orkiestrator._app.astream(stan_poczatkowy, config=config):
-        for wezel, dane in zdarzenie.items():
-            if wezel in ETAPY_PIPELINE:
-                procent, wiadomosc = ETAPY_PIPELINE[wezel]
-                callback_postepu(wezel, procent, wiadomosc)
-            wynik_koncowy = dane
+    # Ponowienie zadania (self.retry) — wznów graf od ostatniego ukończonego
+    # węzła: update_state(as_node=...) odtwarza checkpoint w świeżym
+    # MemorySaver, a astream(None) rusza od kolejnych węzłów
+    wejscie = stan_poczatkowy
+    # Pełny stan składany z delt streamu — bez get_state() po każdym węźle
+    stan_wartosci = dict(stan_poczatkowy)
+    checkpoint = await wczytaj_checkpoint_sesji(sesja_id)
+    if checkpoint:
+        ostatni_wezel, stan_zapisany = checkpoint
+        orkiestrator._app.update_state(config, stan_zapisany, as_node=ostatni_wezel)
+        stan_wartosci.update(stan_zapisany)
+        wejscie = None
+        logger.info("Wznawiam pipeline z checkpointu", sesja_id=sesja_id, wezel=ostatni_wezel)
+    else:
+        # Pola wejściowe (brief, marka...) nie przychodzą w żadnej aktualizacji węzła
+        zaplanuj_zapis_stanu(sesja_id, stan_poczatkowy, zmienione=stan_poczatkowy)
+
+    kolejka_postepu: asyncio.Queue = asyncio.Queue(maxsize=ROZMIAR_BUFORA_POSTEPU)
+    wysylka_postepu = asyncio.create_task(_wysylaj_postep(sesja_id, kolejka_postepu))
 
-    # Pobierz finalny stan
-    stan_finalny = orkiestrator._app.get_state(config)
-    stan_wartosci = stan_finalny.values if hasattr(stan_finalny, "values") else {}
+    try:
+        # Tryb "updates": zdarzenie = {węzeł: delta stanu} — tylko zmienione
+        # pola, bez kopii pełnego stanu po każdym kroku; bez zdarzeń podgrafów
+        async for zdarzenie in orkiestrator._app.astream(
+            wejscie, config=config, stream_mode="updates", subgraphs=False,
+        ):
+            for wezel, dane in zdarzenie.items():
+                zastosuj_aktualizacje(stan_wartosci, dane)
+                etap = ETAPY_PIPELINE.get(wezel)
+                if etap is not None:
+                    procent, wiadomosc = etap
+                    if callback_postepu(wezel, procent, wiadomosc):
+                        await kolejka_postepu.put({
+                            "sesja_id": sesja_id,
+                            "krok": wezel,
+                            "procent": procent,
+                            "wiadomosc": wiadomosc,
+                            "timestamp": time.time(),
+                        })
+            # Kopia — zapis w tle serializuje stan po tym węźle, nie późniejszy
+            zaplanuj_zapis_stanu(
+                sesja_id,
+                dict(stan_wartosci),
+                wezel,
+                zmienione=[k for d in zdarzenie.values() if d for k in d],
+            )
+    finally:
+        # Postęp z bufora przed końcowym "gotowe" / "blad" publikowanym
+        # synchronicznie przez zadanie
+        await kolejka_postepu.join()
+        wysylka_postepu.cancel()
+        # Także przy błędzie — checkpoint musi trafić do Redis, zanim
+        # zadanie Celery zamknie pętlę i zleci ponowienie
+        await oproznij_zapisy_stanu()
+
+    # Checkpoint usuwany dopiero po opróżnieniu kolejki — inaczej spóźniony
+    # zapis odtworzyłby go po zakończonym pipeline
+    await usun_checkpoint_sesji(sesja_id)
 
-    import time as t
     return {
         "sesja_id": sesja_id,
         "status": "sukces" if stan_wartosci.get("wideo") else "czesciowy",
-        "wideo": stan_wartosci.get("wideo"),
-        "scenariusz": stan_wartosci.get("scenariusz"),
-        "audio": stan_wartosci.get("audio"),
-        "wizualia": stan_wartosci.get("wizualia"),
-        "ocena_jakosci": stan_wartosci.get("ocena_jakosci"),
-        "ocena_wiralnosci": stan_wartosci.get("ocena_wiralnosci"),
-        "plan_tresci": stan_wartosci.get("plan_tresci"),
+        **{k: stan_wartosci.get(k) for k in _WYNIK_KLUCZE},
         "bledy": stan_wartosci.get("bledy", []),
         "koszt_usd": round(stan_wartosci.get("koszt_calkowity_usd", 0.0), 4),
         "czas_generacji_s": round(stan_wartosci.get("czas_generacji_s", 0.0), 1),
@@ -228,21 +446,34 @@ async def _uruchom_z_postepem(
     }
 
 
+# Progi NVS (rosnąco) i odznaki — _ODZNAKI[i] obowiązuje od _PROGI_ODZNAK[i - 1]
+_PROGI_ODZNAK: Final = (60, 85)
+_ODZNAKI: Final = ("⚠️ Optymalizuj", "✅ Dobry content", "🔥 Wysoki potencjał")
+
+# Stałe pola planu dla heurystyki — per wywołanie dochodzi tylko brief,
+# platformy i długość
+_PLAN_HEURYSTYKI: Final[Mapping[str, str]] = MappingProxyType({
+    "hak_wizualny": "",
+    "hak_tekstowy": "",
+    "typ_haka": "luk_ciekawosci",
+})
+
+
+def _odznaka(nwv: int) -> str:
+    return _ODZNAKI[bisect.bisect_right(_PROGI_ODZNAK, nwv)]
+
+
 @celery_app.task(
     name="zadania.generacja.analizuj_wiralnosc_task",
     max_retries=1,
 )
 def analizuj_wiralnosc_task(brief: str, platforma: list, dlugosc_sekund: int) -> dict:
     """Zadanie analizy wiralności (szybkie, ~5s)."""
-    from analityka.silnik_wiralnosci import oblicz_nwv_heurystyczny
-
     plan_mock = {
+        **_PLAN_HEURYSTYKI,
         "temat": brief,
         "platforma_docelowa": platforma,
         "dlugosc_sekund": dlugosc_sekund,
-        "hak_wizualny": "",
-        "hak_tekstowy": "",
-        "typ_haka": "luk_ciekawosci",
     }
 
     # Synchroniczna analiza (heurystyczna)
@@ -250,11 +481,21 @@ def analizuj_wiralnosc_task(brief: str, platforma: list, dlugosc_sekund: int) ->
 
     return {
         "wynik_nwv": nwv,
-        "odznaka": "🔥 Wysoki potencjał" if nwv >= 85 else "✅ Dobry content" if nwv >= 60 else "⚠️ Optymalizuj",
+        "odznaka": _odznaka(nwv),
         "wynik_haka": nwv,
         "wynik_zatrzymania": nwv - 5,
         "wynik_udostepnialnosci": nwv - 8,
-        "wynik_platformy": {p: nwv for p in platforma},
+        "wynik_platformy": dict.fromkeys(platforma, nwv),
         "uzasadnienie": "Szybka analiza heurystyczna",
         "wskazowki_optymalizacji": [],
     }
+
+
+def zaplanuj_wiralnosc_wiele(briefy: list[tuple[str, list, int]]) -> GroupResult:
+    """
+    Zleca analizę wiralności wielu briefów naraz — (brief, platforma,
+    dlugosc_sekund) per wpis. Przy fan-oucie z API (np. wszystkie odcinki
+    serii) używaj tego zamiast .delay() w pętli: jedna grupa Celery
+    zamiast osobnego round-tripu do brokera per zadanie.
+    """
+    return group(analizuj_wiralnosc_task.s(*b) for b in briefy).apply_async()